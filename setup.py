@@ -3,7 +3,7 @@ from setuptools import setup
 
 setup(
     name='statify',
-    version='1.3.0',
+    version='1.4.0',
     packages=[
         'statify',
         'statify.webserver',
@@ -24,7 +24,6 @@ setup(
     install_requires=[
         'pypika==0.35.14',
         'pyyaml==5.3.1',
-        'setuptools==49.1.0',
         'spotipy==2.16.0',
         'flask==2.1.2',
     ],
@@ -1,10 +1,21 @@
 import os
 from pathlib import Path
 
-VERSION = '1.3.0'
+VERSION = '1.4.0'
 
 STATIFY_PATH = Path(os.environ.get('STATIFY_DATA',
                     Path.home() / '.data' / 'statify'))
 
 CONFIG_PATH = Path(os.environ.get('STATIFY_CONFIG',
                    Path.home() / '.config' / 'statify.yaml'))
+
+
+def load_config():
+    """
+    Return the content of the config file, or None if there's no config file
+    """
+    if not os.path.exists(str(CONFIG_PATH)):
+        return None
+    import yaml
+    with open(str(CONFIG_PATH)) as config_file:
+        return yaml.safe_load(config_file) or {}
@@ -0,0 +1,164 @@
+"""
+Import of the listenings of Spotify data exports: the StreamingHistory files
+of the account data, and the endsong / Streaming_History_Audio files of the
+extended streaming history. Files are parsed incrementally, so that memory
+doesn't depend on their size.
+"""
+import collections
+import functools
+import itertools
+import json
+from pathlib import Path
+
+from . import database_client
+
+
+EXPORT_FILES_PATTERNS = [
+    'StreamingHistory*.json',
+    'endsong*.json',
+    'Streaming_History_Audio*.json',
+]
+
+# Spotify counts a play as a stream after 30 seconds
+MIN_MS_PLAYED = 30000
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# Number of listenings inserted with a single `executemany`
+IMPORT_BATCH_SIZE = 10000
+
+# Number of (track name, artist name) pairs whose song ID is cached
+RESOLVED_SONGS_CACHE_SIZE = 10000
+
+JSON_SEPARATORS = ' \t\r\n,'
+
+
+ExportedListening = collections.namedtuple('ExportedListening', [
+    'song_id',      # None in the StreamingHistory files
+    'track_name',
+    'artist_name',
+    'played_at',
+    'ms_played',
+])
+
+
+def import_listenings(
+    database, directory,
+    commit_every_rows=database_client.COMMIT_EVERY_ROWS,
+    commit_every_seconds=database_client.COMMIT_EVERY_SECONDS,
+):
+    """
+    Insert the listenings of the export files of the directory which aren't
+    in the database yet, then recount the aggregates. Return the counts of
+    `read`, `imported`, `known` (already in the database), `short` (played
+    less than MIN_MS_PLAYED) and `unresolved` (song not found) listenings.
+    """
+    counts = collections.Counter()
+    resolve_song_id = functools.lru_cache(maxsize=RESOLVED_SONGS_CACHE_SIZE)(
+        database.select_song_id_by_names
+    )
+    commits = database_client.BatchedCommits(
+        database,
+        every_rows=commit_every_rows,
+        every_seconds=commit_every_seconds,
+    )
+
+    for path in export_files(directory):
+        with open(str(path), encoding='utf-8') as export_file:
+            listenings = iter_export_listenings(export_file)
+            while True:
+                batch = list(itertools.islice(listenings, IMPORT_BATCH_SIZE))
+                if not batch:
+                    break
+                rows = []
+                for listening in batch:
+                    if listening.ms_played < MIN_MS_PLAYED:
+                        counts['short'] += 1
+                        continue
+                    song_id = listening.song_id
+                    if song_id is None and listening.track_name is not None:
+                        song_id = resolve_song_id(
+                            listening.track_name, listening.artist_name,
+                        )
+                    if song_id is None:
+                        counts['unresolved'] += 1
+                        continue
+                    rows.append((song_id, listening.played_at))
+                imported = database.insert_imported_listenings(rows)
+                counts['read'] += len(batch)
+                counts['imported'] += imported
+                counts['known'] += len(rows) - imported
+                commits.add(len(rows))
+
+    database.rebuild_listenings_aggregates()
+    commits.commit()
+    return counts
+
+
+def export_files(directory):
+    return sorted({
+        path
+        for pattern in EXPORT_FILES_PATTERNS
+        for path in Path(directory).glob(pattern)
+    })
+
+
+def iter_export_listenings(export_file):
+    for entry in iter_json_array(export_file):
+        if 'ts' in entry:
+            uri = entry.get('spotify_track_uri')
+            yield ExportedListening(
+                song_id=uri.rsplit(':', 1)[-1] if uri else None,
+                track_name=entry.get('master_metadata_track_name'),
+                artist_name=entry.get('master_metadata_album_artist_name'),
+                played_at=entry['ts'],
+                ms_played=entry.get('ms_played') or 0,
+            )
+        else:
+            # endTime is like '2020-05-04 17:17'
+            yield ExportedListening(
+                song_id=None,
+                track_name=entry.get('trackName'),
+                artist_name=entry.get('artistName'),
+                played_at=entry['endTime'].replace(' ', 'T') + ':00Z',
+                ms_played=entry.get('msPlayed') or 0,
+            )
+
+
+def iter_json_array(file, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the values of the JSON array of the file one by one, reading the
+    file by chunks
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    in_array = False
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        if position < len(buffer):
+            if not in_array:
+                if buffer[position] != '[':
+                    raise ValueError("The file isn't a JSON array")
+                in_array = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                end = None
+            # A value ending with the buffer may continue in the next chunk
+            if end is not None and (end < len(buffer) or eof):
+                yield value
+                position = end
+                continue
+        if eof:
+            raise ValueError("Invalid or truncated JSON array")
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
@@ -1,12 +1,14 @@
 import collections
+import datetime
+import difflib
+import functools
+import operator
 import os
+import queue
+import re
 import sqlite3
 import threading
-from distutils.version import LooseVersion
-
-import pkg_resources
-import pypika
-from pypika import Query, PostgreSQLQuery, Parameter, Table
+import time
 
 from . import config
 
@@ -15,81 +17,240 @@ DATABASE_PATH = config.STATIFY_PATH / 'statify.sqlite'
 DATABASE_VERSION_PATH = config.STATIFY_PATH / 'database_version'
 
 
-Song = collections.namedtuple('Song', [
-    'spotify_id',
-    'web_url',
-    'api_url',
-    'duration',
-    'explicit',
-    'isrc',
-    'is_local',
-    'name',
-    'popularity',
-    'preview_url',
-    'track_number',
-    'album_id',
-    'cover_url',
-    'album_name',
-    'artists_names',
-])
-
-
-Artist = collections.namedtuple('Artist', [
-    'spotify_id',
-    'web_url',
-    'api_url',
-    'name',
-])
-
-
-Album = collections.namedtuple('Album', [
-    'spotify_id',
-    'web_url',
-    'api_url',
-    'name',
-    'release_date',
-    'release_date_precision',
-    'type',
-    'cover_url',
-])
-
-
-Playlist = collections.namedtuple('Playlist', [
-    'spotify_id',
-    'web_url',
-    'api_url',
-    'cover_url',
-    'name',
-    'owner_name',
-    'is_public',
-])
-
-
-Listening = collections.namedtuple('Listening', [
-    'song_id',
-    'played_at',
-    'context',      # 'playlist' or 'album' or None
-    'album_id',     # if context == 'album'
-    'playlist_id',  # if context == 'playlist'
-])
+# Connection profiles
+WRITER = 'writer'
+READER = 'reader'
+
+# Pragmas applied to each new connection, by profile. In WAL mode readers
+# don't block the writer and reciprocally, so that the webserver can serve
+# while a pull is running. The journal mode is persistent, so it only needs
+# to be set by writers.
+DEFAULT_PRAGMAS = {
+    WRITER: {
+        'journal_mode': 'WAL',
+        # Durable in WAL mode, except on power loss for the last commits
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,  # KiB
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,  # ms
+    },
+    READER: {
+        'cache_size': -16000,  # KiB
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,  # ms
+    },
+}
+
+
+class Entity:
+    """
+    Row of the table named after the class. Subclasses declare the columns in
+    `__slots__`, in the order of the values of the statements, and the
+    default values of the optional ones in `_defaults`.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _defaults = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = tuple(cls.__slots__)
+        cls._values = operator.attrgetter(*cls._fields)
+
+    def __init__(self, *values, **named_values):
+        if len(values) > len(self._fields):
+            raise TypeError("{}() takes {} values but {} were given".format(
+                type(self).__name__, len(self._fields), len(values),
+            ))
+        for field, value in zip(self._fields, values):
+            setattr(self, field, value)
+        for field in self._fields[len(values):]:
+            if field in named_values:
+                value = named_values.pop(field)
+            elif field in self._defaults:
+                value = self._defaults[field]
+            else:
+                raise TypeError("{}() missing value: '{}'".format(
+                    type(self).__name__, field,
+                ))
+            setattr(self, field, value)
+        if named_values:
+            raise TypeError("{}() got unexpected values: {}".format(
+                type(self).__name__, ', '.join(named_values),
+            ))
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Map a row having a column for each field, such as a sqlite3.Row
+        """
+        entity = cls.__new__(cls)
+        for field in cls._fields:
+            setattr(entity, field, row[field])
+        return entity
+
+    def astuple(self):
+        """
+        Values in the order of the fields, as given to the statements
+        """
+        return self._values(self)
+
+    def asdict(self):
+        return dict(zip(self._fields, self._values(self)))
+
+    def replace(self, **changes):
+        return type(self)(**{**self.asdict(), **changes})
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(field, value)
+            for field, value in zip(self._fields, self.astuple())
+        ))
+
+
+class Song(Entity):
+    __slots__ = (
+        'spotify_id',
+        'web_url',
+        'api_url',
+        'duration',
+        'explicit',
+        'isrc',
+        'is_local',
+        'name',
+        'popularity',
+        'preview_url',
+        'track_number',
+        'album_id',
+        'cover_url',
+        'album_name',
+        'artists_names',
+    )
+
+
+class Artist(Entity):
+    __slots__ = (
+        'spotify_id',
+        'web_url',
+        'api_url',
+        'name',
+    )
+
+
+class Album(Entity):
+    __slots__ = (
+        'spotify_id',
+        'web_url',
+        'api_url',
+        'name',
+        'release_date',
+        'release_date_precision',
+        'type',
+        'cover_url',
+    )
+
+
+class Playlist(Entity):
+    __slots__ = (
+        'spotify_id',
+        'web_url',
+        'api_url',
+        'cover_url',
+        'name',
+        'owner_name',
+        'is_public',
+        'snapshot_id',
+    )
+
+
+class Listening(Entity):
+    __slots__ = (
+        'song_id',
+        'played_at',
+        'context',       # 'playlist' or 'album' or None
+        'album_id',      # if context == 'album'
+        'playlist_id',   # if context == 'playlist'
+        'listening_id',  # assigned by the database when None
+    )
+    _defaults = {'listening_id': None}
+
+
+# Default number of rows and of seconds between the commits of an ingest
+COMMIT_EVERY_ROWS = 5000
+COMMIT_EVERY_SECONDS = 30
+
+
+# Gap between the positions of consecutive tracks of a playlist, leaving room
+# for the tracks inserted later without moving the others
+POSITION_GAP = 1024
+
+
+# Maximum number of IDs cached per table by StatifyDatabase.select_known
+KNOWN_IDS_SIZE = 10000
+
+# An imported listening is the same as a listening of the same song less than
+# this many seconds apart: the timestamps of the exports and of the API can
+# differ by a few seconds, and the account data ones are truncated to the
+# minute
+IMPORT_DEDUPE_WINDOW = 60
 
 
 class StatifyDatabase:
+    """
+    The `profile` (WRITER or READER) sets the default pragmas of the
+    connections, which can be overridden with `pragmas`. READER connections
+    are read-only. By default, each thread using the client gets its own
+    connection. With `shared_connection`, a single connection is used
+    whatever the thread, and the caller is responsible for not using the
+    client from several threads at once. `check_version` can be disabled
+    when the version of the database is known to be up to date, to skip
+    reading the version file.
+    `known_ids_size` bounds the caches of IDs used by `select_known`.
+    """
 
-    def __init__(self, path=str(DATABASE_PATH)):
+    def __init__(
+        self, path=str(DATABASE_PATH), profile=WRITER, pragmas=None,
+        check_version=True, shared_connection=False,
+        known_ids_size=KNOWN_IDS_SIZE,
+    ):
         self.path = path
+        self.profile = profile
+        self.pragmas = {**DEFAULT_PRAGMAS[profile], **(pragmas or {})}
+        self.shared_connection = shared_connection
         self.connections = {}
+        self.known_ids_size = known_ids_size
+        self.known_ids = {}
 
+        if check_version:
+            self._check_version()
+
+    def _check_version(self):
         found_version = _get_database_version()
 
-        parse_version = pkg_resources.parse_version
+        parse_version = _parse_version
         if (
             found_version is None or
             parse_version(found_version) < parse_version(config.VERSION)
         ):
             updates = _get_database_updates(found_version)
-            for sql_statement in updates:
-                self._sql(sql_statement)
+            # The sqlite3 module doesn't open transactions before DDL
+            # statements: without an explicit one, a failing update would
+            # leave the previous ones applied, but not the version
+            self._connection().execute('BEGIN IMMEDIATE')
+            try:
+                for sql_statement in updates:
+                    self._sql(sql_statement)
+            except BaseException:
+                self.rollback()
+                raise
             self.commit()
             _set_database_version(config.VERSION)
         elif parse_version(found_version) == parse_version(config.VERSION):
@@ -104,80 +265,255 @@ class StatifyDatabase:
         return self._sql(str(query), params)
 
     def _sql(self, query, params=None):
-        current_thread_id = threading.get_ident()
-        if self.connections.get(current_thread_id) is None:
-            connection = sqlite3.connect(self.path)
-            connection.row_factory = sqlite3.Row
-            self.connections[current_thread_id] = connection
-        else:
-            connection = self.connections[current_thread_id]
-        c = connection.cursor()
+        c = self._connection().cursor()
         if params is None:
             c.execute(query)
         else:
             c.execute(query, params)
         return c
 
-    def insert(self, data):
-        tuple_type = type(data)
-        q = (
-            Query.into(tuple_type.__name__)
-            .columns(*tuple_type._fields)
-            .insert(*_pypika_params(len(tuple_type._fields)))
+    def _execute_many(self, sql, params_seq):
+        c = self._connection().cursor()
+        c.executemany(sql, params_seq)
+        return c
+
+    def _connection(self):
+        connection_key = self._connection_key()
+        if self.connections.get(connection_key) is None:
+            connection = self._connect()
+            self.connections[connection_key] = connection
+        else:
+            connection = self.connections[connection_key]
+        return connection
+
+    def _connection_key(self):
+        if self.shared_connection:
+            return None
+        return threading.get_ident()
+
+    def _connect(self):
+        readonly = self.profile == READER and self.path != ':memory:'
+        if readonly:
+            # urllib.request is slow to import and only needed by readers
+            from urllib.request import pathname2url
+            database = 'file:{}?mode=ro'.format(pathname2url(self.path))
+        else:
+            database = self.path
+        connection = sqlite3.connect(
+            database,
+            uri=readonly,
+            check_same_thread=not self.shared_connection,
+            # Writers take the write lock when their transaction begins,
+            # rather than failing to upgrade a read lock in the middle of it
+            isolation_level='IMMEDIATE' if self.profile == WRITER else '',
         )
-        c = self._execute(q, data)
+        connection.row_factory = sqlite3.Row
+        # Unlike SQLite's lower(), folds the case of non-ASCII characters
+        connection.create_function(
+            'casefold', 1, _casefold, deterministic=True,
+        )
+        for name, value in self.pragmas.items():
+            connection.execute('PRAGMA {} = {}'.format(name, value))
+        return connection
+
+    def insert(self, data):
+        entity_type = type(data)
+        sql = _insert_statement(entity_type.__name__, entity_type._fields)
+        c = self._sql(sql, data.astuple())
         return c.rowcount > 0
 
     def insert_or_update(self, data, conflict_column):
-        tuple_type = type(data)
-        q = self._insert_on_conflict(data, conflict_column)
-        for field_name, value in zip(tuple_type._fields, data):
-            q = q.do_update(field_name, Parameter('?'))
-        # 2*data = one time for insert and second time for do update
-        c = self._execute(q, 2 * data)
+        entity_type = type(data)
+        sql = _insert_on_conflict_statement(
+            entity_type.__name__, entity_type._fields, conflict_column, 'update',
+        )
+        # 2*values = one time for insert and second time for do update
+        c = self._sql(sql, 2 * data.astuple())
         return c.rowcount > 0
 
     def insert_or_leave(self, data, conflict_column):
-        q = self._insert_on_conflict(data, conflict_column)
-        q = q.do_nothing()
-        c = self._execute(q, data)
+        entity_type = type(data)
+        sql = _insert_on_conflict_statement(
+            entity_type.__name__, entity_type._fields, conflict_column,
+            'nothing',
+        )
+        c = self._sql(sql, data.astuple())
         return c.rowcount > 0
 
-    def _insert_on_conflict(self, data, conflict_column):
-        tuple_type = type(data)
+    def bulk_insert(self, rows):
+        """
+        Insert entities of the same type with a single `executemany`
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        entity_type = type(rows[0])
+        sql = _insert_statement(entity_type.__name__, entity_type._fields)
+        self._execute_many(sql, map(entity_type.astuple, rows))
+
+    def bulk_insert_or_leave(self, rows, conflict_column):
+        """
+        Same as `insert_or_leave` for many entities of the same type, with a
+        single `executemany`
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        entity_type = type(rows[0])
+        sql = _insert_on_conflict_statement(
+            entity_type.__name__, entity_type._fields, conflict_column,
+            'nothing',
+        )
+        self._execute_many(sql, map(entity_type.astuple, rows))
+
+    def bulk_insert_or_update(self, rows, conflict_column):
+        """
+        Same as `insert_or_update` for many entities of the same type, with a
+        single `executemany`
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        entity_type = type(rows[0])
+        sql = _insert_on_conflict_statement(
+            entity_type.__name__, entity_type._fields, conflict_column,
+            'update',
+        )
+        self._execute_many(sql, (2 * row.astuple() for row in rows))
+
+    def bulk_insert_into(self, table_name, columns, rows):
+        """
+        Same as `insert_into` for many rows given as tuples of values for the
+        given columns, with a single `executemany`
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        sql = _insert_statement(table_name, tuple(columns))
+        self._execute_many(sql, rows)
+
+    def select_existing(self, table_name, column, values):
+        """
+        Return the subset of the given values found in the column of the table
+        """
+        values = list(values)
+        existing = set()
+        for i in range(0, len(values), SQL_MAX_VARIABLES):
+            chunk = values[i:i+SQL_MAX_VARIABLES]
+            sql = _select_in_statement(table_name, column, len(chunk))
+            existing.update(row[0] for row in self._sql(sql, chunk))
+        return existing
+
+    def clear_staged_playlist_tracks(self):
+        self._sql(CREATE_STAGED_PLAYLIST_TRACKS_STATEMENT)
+        self._sql(CLEAR_STAGED_PLAYLIST_TRACKS_STATEMENT)
+
+    def stage_playlist_tracks(self, rows):
+        """
+        Append (song_id, added_at) rows to the staged tracks of a playlist, in
+        a temporary table
+        """
+        self._execute_many(STAGE_PLAYLIST_TRACKS_STATEMENT, rows)
+
+    def apply_staged_playlist_tracks(self, playlist_id):
+        """
+        Make the tracks of the playlist match the staged ones, position
+        included, by applying a minimal edit script: only the removed and
+        added tracks are written, and recorded in PlaylistEdit. Return the
+        IDs of the removed songs, and the (ID, name) of the added ones.
+        """
+        stored = self._sql(
+            SELECT_PLAYLIST_TRACKS_STATEMENT, (playlist_id,),
+        ).fetchall()
+        staged = self._sql(SELECT_STAGED_TRACKS_STATEMENT).fetchall()
+        deleted, inserted, moved = _plan_playlist_edits(
+            [row['song_id'] for row in stored],
+            [row['position'] for row in stored],
+            [row['song_id'] for row in staged],
+        )
+
+        self._execute_many(
+            DELETE_PLAYLIST_TRACK_STATEMENT,
+            [(stored[i]['rowid'],) for i in deleted],
+        )
+        self._execute_many(
+            UPDATE_PLAYLIST_TRACK_POSITION_STATEMENT,
+            [(position, stored[i]['rowid']) for i, position in moved],
+        )
+        self.bulk_insert_into(
+            'SongInPlaylist',
+            ['song_id', 'playlist_id', 'added_at', 'position'],
+            [
+                (
+                    staged[j]['song_id'], playlist_id, staged[j]['added_at'],
+                    position,
+                )
+                for j, position in inserted
+            ],
+        )
+
+        date = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.bulk_insert_into(
+            'PlaylistEdit',
+            ['playlist_id', 'date', 'operation', 'song_id', 'position'],
+            [
+                (playlist_id, date, 'delete', stored[i]['song_id'], i)
+                for i in deleted
+            ] + [
+                (playlist_id, date, 'insert', staged[j]['song_id'], j)
+                for j, _ in inserted
+            ],
+        )
+
         return (
-            PostgreSQLQuery.into(tuple_type.__name__)
-            .columns(*tuple_type._fields)
-            .insert(*_pypika_params(len(tuple_type._fields)))
-            .on_conflict(conflict_column)
+            [stored[i]['song_id'] for i in deleted],
+            [(staged[j]['song_id'], staged[j]['name']) for j, _ in inserted],
         )
 
+    def select_known(self, table_name, ids):
+        """
+        Same as `select_existing` on the spotify_id column of the table, but
+        the IDs known from previous calls are answered from a cache, which is
+        warmed with the latest rows of the table on first use
+        """
+        known_ids = self._known_ids(table_name)
+        ids = set(ids)
+        known = {id_ for id_ in ids if known_ids.touch(id_)}
+        existing = self.select_existing(table_name, 'spotify_id', ids - known)
+        known_ids.update(existing)
+        return known | existing
+
+    def remember_known(self, table_name, ids):
+        """
+        Add IDs inserted in the table to its cache of known IDs
+        """
+        self._known_ids(table_name).update(ids)
+
+    def _known_ids(self, table_name):
+        known_ids = self.known_ids.get(table_name)
+        if known_ids is None:
+            known_ids = KnownIds(self.known_ids_size)
+            latest_ids = self._sql(
+                _select_latest_ids_statement(table_name),
+                (self.known_ids_size,),
+            ).fetchall()
+            known_ids.update(row[0] for row in reversed(latest_ids))
+            self.known_ids[table_name] = known_ids
+        return known_ids
+
     def select_from(self, table_name, columns, order_by=None, **selectors):
-        table = Table(table_name)
-        q = Query.from_(table).select(*columns)
-        params = []
-        for col, value in selectors.items():
-            q = q.where(getattr(table, col) == Parameter('?'))
-            params.append(value)
-        if order_by is not None:
-            q = q.orderby(order_by)
-        return self._execute(q, tuple(params)).fetchall()
+        sql = _select_statement(
+            table_name, tuple(columns), tuple(selectors.keys()), order_by,
+        )
+        return self._sql(sql, tuple(selectors.values())).fetchall()
 
     def delete_from(self, table_name, **selectors):
-        table = Table(table_name)
-        q = Query.from_(table).delete()
-        params = []
-        for col, value in selectors.items():
-            q = q.where(getattr(table, col) == Parameter('?'))
-            params.append(value)
-        return self._execute(q, tuple(params))
+        sql = _delete_statement(table_name, tuple(selectors.keys()))
+        return self._sql(sql, tuple(selectors.values()))
 
     def insert_into(self, table_name, **values):
-        values = [(col, val) for col, val in values.items()]
-        q = (Query.into(table_name)
-             .columns(*(t[0] for t in values))
-             .insert(*_pypika_params(len(values))))
-        return self._execute(q, tuple(t[1] for t in values))
+        sql = _insert_statement(table_name, tuple(values.keys()))
+        return self._sql(sql, tuple(values.values()))
 
     def select_song_by_spotify_id(self, spotify_id):
         results = self.select_from(
@@ -185,13 +521,13 @@ class StatifyDatabase:
             spotify_id=spotify_id,
         )
         if results:
-            return dict(results[0])
+            return Song.from_row(results[0])
         else:
             return None
 
     def select_listenings_by_spotify_id(self, spotify_id):
         return [
-            dict(row) for row in
+            Listening.from_row(row) for row in
             self.select_from(
                 'Listening', '*',
                 song_id=spotify_id,
@@ -199,48 +535,333 @@ class StatifyDatabase:
             )
         ]
 
-    def search_songs(self, words):
-        songs = Table('Song')
-        q = Query.from_(songs).select('*')
-
-        and_close = pypika.terms.Criterion.any()
-        for w in words:
-            and_close &= (
-                songs.name.like(Parameter('?')) |
-                songs.name.like(Parameter('?')) |
-                songs.artists_names.like(Parameter('?')) |
-                songs.artists_names.like(Parameter('?'))
+    def search_songs(self, words, limit=5):
+        """
+        Return the `limit` best songs whose name or artists' names contain
+        words starting with each of the given words. Only the
+        SEARCH_CANDIDATES most relevant matches according to bm25 are ranked,
+        so that the cost of a search is bounded, along with as many matches
+        having each word as a whole token: bm25 doesn't tell them from prefix
+        matches, while they get the best scores.
+        """
+        words = [_casefold(w) for w in words]
+        prefix_expression = _fts_query(words, prefix=True)
+        if prefix_expression is None:
+            return []
+        exact_expression = _fts_query(words, prefix=False)
+        score_params = [
+            param for w in words for param in _match_score_params(w)
+        ]
+        return [
+            Song.from_row(row) for row in
+            self._sql(
+                _search_songs_statement(len(words)),
+                (
+                    prefix_expression, SEARCH_CANDIDATES,
+                    exact_expression, SEARCH_CANDIDATES,
+                    *score_params, limit,
+                ),
             )
+        ]
 
-        q = q.where(and_close).limit(5)
-
+    def select_ids_to_hydrate(self, table_name):
+        """
+        Return the IDs of the rows of the table (Song, Album or Artist) which
+        are referenced but missing, or whose metadata is partial. For
+        SongByArtist, return the IDs of the songs linked to no artist.
+        """
         return [
-            dict(row) for row in
-            self._execute(
-                q,
-                # just move along, nothing to see here
-                tuple([
-                    f"{'% ' if i%2 == 0 else ''}{w}%"
-                    for zipped in zip(*([words]*4))
-                    for i, w in enumerate(zipped)
-                ])
-            ).fetchall()
+            row[0] for row in self._sql(HYDRATION_STATEMENTS[table_name])
         ]
 
+    def rebuild_listenings_aggregates(self):
+        """
+        Recount all the listenings into the aggregate tables, e.g. after a
+        bulk import
+        """
+        for table_name in AGGREGATE_TABLES:
+            self._sql('DELETE FROM `{}`'.format(table_name))
+        for sql_statement in AGGREGATES_BACKFILL_STATEMENTS:
+            self._sql(sql_statement)
+
+    def insert_imported_listenings(self, rows):
+        """
+        Insert (song_id, played_at) rows of listenings imported from a data
+        export, unless the song already has a listening less than
+        IMPORT_DEDUPE_WINDOW seconds apart. Return the number of inserted
+        listenings.
+        """
+        window = datetime.timedelta(seconds=IMPORT_DEDUPE_WINDOW)
+        one_second = datetime.timedelta(seconds=1)
+        params = []
+        for song_id, played_at in rows:
+            # Stored timestamps differ in precision and suffix, but all start
+            # with the second, so bounds at the second compare as strings
+            played_at_second = datetime.datetime.strptime(
+                played_at[:19], PLAYED_AT_SECOND_FORMAT,
+            )
+            window_start = played_at_second - window
+            window_end = played_at_second + window + one_second
+            params.append((
+                song_id, played_at,
+                window_start.strftime(PLAYED_AT_SECOND_FORMAT),
+                window_end.strftime(PLAYED_AT_SECOND_FORMAT),
+                song_id,
+            ))
+        c = self._execute_many(INSERT_IMPORTED_LISTENING_STATEMENT, params)
+        return c.rowcount
+
+    def select_song_id_by_names(self, name, artist_name):
+        """
+        Return the ID of a song with the given name and among whose artists
+        is the given one, or None
+        """
+        row = self._sql(
+            SELECT_SONG_ID_BY_NAMES_STATEMENT, (name, artist_name),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def update_listenings_aggregates(self, listenings):
+        """
+        Add the given (newly inserted) listenings to the aggregated counts.
+        The artists of their songs must already be in the database.
+        """
+        counts = {
+            'day': collections.Counter(),
+            'hour': collections.Counter(),
+            'song_id': collections.Counter(),
+        }
+        for listening in listenings:
+            counts['day'][listening.played_at[:10]] += 1
+            counts['hour'][listening.played_at[11:13]] += 1
+            counts['song_id'][listening.song_id] += 1
+
+        for table_name, key in [
+            ('ListeningsByDay', 'day'),
+            ('ListeningsByHour', 'hour'),
+            ('ListeningsBySong', 'song_id'),
+        ]:
+            self._execute_many(
+                _increment_count_statement(table_name, key),
+                counts[key].items(),
+            )
+        self._execute_many(
+            INCREMENT_ARTISTS_COUNTS_STATEMENT,
+            [
+                (count, song_id)
+                for song_id, count in counts['song_id'].items()
+            ],
+        )
+
+    def select_last_played_at(self):
+        """
+        Return the played_at of the newest listening in the database, or None.
+        It's the high-water mark recorded by the last retrieval if any,
+        otherwise it's looked up in the index of the listenings.
+        """
+        retrieval = self._sql(LAST_RETRIEVAL_PLAYED_AT_STATEMENT).fetchone()
+        if retrieval is not None and retrieval[0] is not None:
+            return retrieval[0]
+        return self._sql(LAST_LISTENING_PLAYED_AT_STATEMENT).fetchone()[0]
+
     def query(self, q, *params):
         return self._execute(q, params)
 
     def commit(self):
-        connection = self.connections.get(threading.get_ident())
+        connection = self.connections.get(self._connection_key())
         if connection is not None:
             connection.commit()
 
+    def rollback(self):
+        connection = self.connections.get(self._connection_key())
+        if connection is not None:
+            connection.rollback()
+        # IDs remembered during the transaction may have been rolled back
+        self.known_ids = {}
+
     def close(self):
-        connection = self.connections.get(threading.get_ident())
+        connection = self.connections.pop(self._connection_key(), None)
         if connection is not None:
             connection.close()
 
 
+def _plan_playlist_edits(stored_ids, stored_positions, staged_ids):
+    """
+    Compute the edit script turning the stored songs of a playlist into the
+    staged ones, from their longest matching subsequences. Return:
+     - the indexes of the stored tracks to delete
+     - (staged index, position) pairs of the tracks to insert
+     - (stored index, position) pairs of the kept tracks to move
+
+    Kept tracks don't move, unless there's no room left between two of them
+    for the inserted tracks (or they have no position yet): then all the
+    tracks are renumbered.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, stored_ids, staged_ids, autojunk=False,
+    )
+    deleted = []
+    kept = {}  # staged index: stored index
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            kept.update(zip(range(j1, j2), range(i1, i2)))
+        else:
+            deleted.extend(range(i1, i2))
+
+    renumber = any(stored_positions[i] is None for i in kept.values())
+    inserted = []
+    j = 0
+    while j < len(staged_ids) and not renumber:
+        if j in kept:
+            j += 1
+            continue
+        end = j
+        while end < len(staged_ids) and end not in kept:
+            end += 1
+        nb_inserted = end - j
+        lower = stored_positions[kept[j-1]] if j > 0 else 0
+        if end < len(staged_ids):
+            upper = stored_positions[kept[end]]
+        else:
+            upper = lower + (nb_inserted + 1) * POSITION_GAP
+        if upper - lower <= nb_inserted:
+            renumber = True
+            break
+        for k in range(nb_inserted):
+            inserted.append(
+                (j + k, lower + (upper - lower) * (k + 1) // (nb_inserted + 1))
+            )
+        j = end
+
+    moved = []
+    if renumber:
+        inserted = []
+        for j in range(len(staged_ids)):
+            position = (j + 1) * POSITION_GAP
+            if j not in kept:
+                inserted.append((j, position))
+            elif stored_positions[kept[j]] != position:
+                moved.append((kept[j], position))
+
+    return deleted, inserted, moved
+
+
+class BatchedCommits:
+    """
+    Commit the writes of an ingest once `every_rows` rows were written or
+    `every_seconds` seconds elapsed since the last commit, whichever comes
+    first, instead of after each unit of work. `on_commit` is called after
+    each commit, e.g. to checkpoint what is now durable.
+    """
+
+    def __init__(
+        self, database, every_rows=COMMIT_EVERY_ROWS,
+        every_seconds=COMMIT_EVERY_SECONDS, on_commit=None,
+    ):
+        self.database = database
+        self.every_rows = every_rows
+        self.every_seconds = every_seconds
+        self.on_commit = on_commit
+        self.pending_rows = 0
+        self._last_commit = time.monotonic()
+
+    def add(self, nb_rows=1):
+        """
+        Count rows written since the last commit, and commit if it's due
+        """
+        self.pending_rows += nb_rows
+        if (
+            self.pending_rows >= self.every_rows or
+            time.monotonic() - self._last_commit >= self.every_seconds
+        ):
+            self.commit()
+
+    def commit(self):
+        self.database.commit()
+        self.pending_rows = 0
+        self._last_commit = time.monotonic()
+        if self.on_commit is not None:
+            self.on_commit()
+
+
+class KnownIds:
+    """
+    Set of the IDs known to be in a table, holding at most `size` IDs. The
+    least recently used ones are evicted first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._ids = collections.OrderedDict()
+
+    def __contains__(self, id_):
+        return id_ in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def touch(self, id_):
+        """
+        Mark the ID as recently used, and return whether it's known
+        """
+        if id_ not in self._ids:
+            return False
+        self._ids.move_to_end(id_)
+        return True
+
+    def update(self, ids):
+        for id_ in ids:
+            self._ids[id_] = None
+            self._ids.move_to_end(id_)
+        while len(self._ids) > self.size:
+            self._ids.popitem(last=False)
+
+
+class DatabasePool:
+    """
+    Pool of READER database clients, each with a single connection, to be
+    acquired for the time of a unit of work (e.g. a request) and released
+    afterwards. The version of the database is checked once, when creating
+    the pool, and at most `size` clients are opened.
+    """
+
+    def __init__(self, path=str(DATABASE_PATH), size=8, pragmas=None):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas
+        self._clients = queue.LifoQueue()
+        self._nb_clients = 0
+        self._lock = threading.Lock()
+
+        # Checks the version of the database, and makes sure it's in WAL mode
+        # (see WRITER pragmas), which can't be set from a read-only connection
+        database = StatifyDatabase(self.path)
+        database._connection()
+        database.close()
+
+    def acquire(self):
+        try:
+            return self._clients.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._nb_clients < self.size
+            if can_open:
+                self._nb_clients += 1
+        if can_open:
+            return StatifyDatabase(
+                self.path,
+                profile=READER,
+                pragmas=self.pragmas,
+                check_version=False,
+                shared_connection=True,
+            )
+        return self._clients.get()
+
+    def release(self, database):
+        self._clients.put(database)
+
+
 class DowngradeVersionError(Exception):
 
     def __init__(self, message, version):
@@ -250,10 +871,321 @@ class DowngradeVersionError(Exception):
 
 # SQL utils
 
+INCREMENT_ARTISTS_COUNTS_STATEMENT = """
+    INSERT INTO `ListeningsByArtist` (`artist_id`, `play_count`)
+    SELECT `artist_id`, ? FROM `SongByArtist` WHERE `song_id` = ?
+    ON CONFLICT (`artist_id`)
+    DO UPDATE SET `play_count` = `play_count` + excluded.`play_count`
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _increment_count_statement(table_name, key):
+    return """
+        INSERT INTO `{table}` (`{key}`, `play_count`) VALUES (?, ?)
+        ON CONFLICT (`{key}`)
+        DO UPDATE SET `play_count` = `play_count` + excluded.`play_count`
+    """.format(table=table_name, key=key)
+
+
+# Songs not linked to any artist: before 1.4, songs were only linked to their
+# artists when the artists were new
+SONGS_WITHOUT_ARTISTS_STATEMENT = """
+    SELECT `spotify_id` FROM `Song`
+    WHERE NOT `is_local`
+    AND `spotify_id` NOT IN (SELECT `song_id` FROM `SongByArtist`)
+"""
+
+
+# IDs of the songs, albums and artists to fetch from the API
+HYDRATION_STATEMENTS = {
+    'Song': """
+        SELECT DISTINCT `song_id` FROM `Listening`
+        WHERE `song_id` NOT LIKE 'local:%'
+        AND `song_id` NOT IN (SELECT `spotify_id` FROM `Song`)
+        UNION
+        SELECT `spotify_id` FROM `Song`
+        WHERE `popularity` IS NULL AND NOT `is_local`
+        UNION
+    """ + SONGS_WITHOUT_ARTISTS_STATEMENT,
+    'SongByArtist': SONGS_WITHOUT_ARTISTS_STATEMENT,
+    'Album': """
+        SELECT DISTINCT `album_id` FROM `Song`
+        WHERE `album_id` IS NOT NULL
+        AND `album_id` NOT IN (SELECT `spotify_id` FROM `Album`)
+        UNION
+        SELECT `spotify_id` FROM `Album` WHERE `release_date` IS NULL
+    """,
+    'Artist': """
+        SELECT DISTINCT `artist_id` FROM `SongByArtist`
+        WHERE `artist_id` NOT IN (SELECT `spotify_id` FROM `Artist`)
+        UNION
+        SELECT `spotify_id` FROM `Artist` WHERE `name` IS NULL
+    """,
+}
+
+
+AGGREGATE_TABLES = [
+    'ListeningsByDay',
+    'ListeningsByHour',
+    'ListeningsBySong',
+    'ListeningsByArtist',
+]
+
+
+PLAYED_AT_SECOND_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+INSERT_IMPORTED_LISTENING_STATEMENT = """
+    INSERT INTO `Listening` (`song_id`, `played_at`)
+    SELECT ?, ?
+    WHERE NOT EXISTS (
+        SELECT 1 FROM `Listening`
+        WHERE `played_at` >= ? AND `played_at` < ? AND `song_id` = ?
+    )
+"""
+
+
+# Artists names of songs are sorted and joined with ', '
+SELECT_SONG_ID_BY_NAMES_STATEMENT = """
+    SELECT `spotify_id` FROM `Song`
+    WHERE `name` = ?
+    AND instr(', ' || `artists_names` || ', ', ', ' || ? || ', ') > 0
+    LIMIT 1
+"""
+
+
+# Tracks of a playlist being pulled, compared with the saved ones once all
+# pages are fetched
+
+CREATE_STAGED_PLAYLIST_TRACKS_STATEMENT = """
+    CREATE TEMP TABLE IF NOT EXISTS `StagedSongInPlaylist` (
+        `position` INTEGER PRIMARY KEY,
+        `song_id`  TEXT,
+        `added_at` TEXT
+    )
+"""
+
+
+CLEAR_STAGED_PLAYLIST_TRACKS_STATEMENT = """
+    DELETE FROM temp.`StagedSongInPlaylist`
+"""
+
+
+STAGE_PLAYLIST_TRACKS_STATEMENT = """
+    INSERT INTO temp.`StagedSongInPlaylist` (`song_id`, `added_at`)
+    VALUES (?, ?)
+"""
+
+
+SELECT_STAGED_TRACKS_STATEMENT = """
+    SELECT `s`.`song_id`, `s`.`added_at`, `Song`.`name`
+    FROM temp.`StagedSongInPlaylist` `s`
+    LEFT JOIN `Song` ON `Song`.`spotify_id` = `s`.`song_id`
+    ORDER BY `s`.`position`
+"""
+
+
+# Tracks saved before positions were stored have a NULL position, and are
+# ordered by insertion
+SELECT_PLAYLIST_TRACKS_STATEMENT = """
+    SELECT `rowid`, `song_id`, `position` FROM `SongInPlaylist`
+    WHERE `playlist_id` = ?
+    ORDER BY `position`, `rowid`
+"""
+
+
+DELETE_PLAYLIST_TRACK_STATEMENT = """
+    DELETE FROM `SongInPlaylist` WHERE `rowid` = ?
+"""
+
+
+UPDATE_PLAYLIST_TRACK_POSITION_STATEMENT = """
+    UPDATE `SongInPlaylist` SET `position` = ? WHERE `rowid` = ?
+"""
+
+
+LAST_RETRIEVAL_PLAYED_AT_STATEMENT = """
+    SELECT `to_played_at` FROM `ListeningsRetrieval`
+    ORDER BY `rowid` DESC LIMIT 1
+"""
+
+
+LAST_LISTENING_PLAYED_AT_STATEMENT = """
+    SELECT max(`played_at`) FROM `Listening`
+"""
+
+
+# Number of full-text matches ranked by a search, among the prefix matches
+# and among the whole token matches
+SEARCH_CANDIDATES = 200
+
+
+@functools.lru_cache(maxsize=None)
+def _search_songs_statement(nb_words):
+    """
+    Full-text search of songs, whose candidates are ranked by how well their
+    name and artists' names match each word (see `_match_score_terms`), then
+    by bm25 relevance, with the name weighting more than the artists' names
+    """
+    score = ' + '.join(
+        term
+        for _ in range(nb_words)
+        for field in ['name', 'artists_names']
+        for term in _match_score_terms('casefold(`Song`.`{}`)'.format(field))
+    )
+    matches = """
+        SELECT * FROM (
+            SELECT `rowid`, bm25(`SongSearch`, 2.0, 1.0) AS `relevance`
+            FROM `SongSearch`
+            WHERE `SongSearch` MATCH ?
+            ORDER BY `relevance`
+            LIMIT ?
+        )
+    """
+    return """
+        WITH `Candidate` AS (
+            SELECT `rowid`, min(`relevance`) AS `relevance`
+            FROM ({} UNION ALL {})
+            GROUP BY `rowid`
+        )
+        SELECT `Song`.* FROM `Candidate`
+        JOIN `Song` ON `Song`.`rowid` = `Candidate`.`rowid`
+        ORDER BY {} DESC, `Candidate`.`relevance`
+        LIMIT ?
+    """.format(matches, matches, score)
+
+
+def _match_score_terms(value):
+    """
+    SQL terms, each worth 1 if true, scoring how well a word matches the given
+    casefolded value. The word is to be given as parameters (see
+    `_match_score_params`). The value:
+     - contains the word
+     - starts with the word
+     - has the word as one of its tokens
+     - has the word as its first token
+     - is the word
+    """
+    return [
+        "(instr({}, ?) > 0)".format(value),
+        "(substr({}, 1, length(?)) = ?)".format(value),
+        "(instr(' ' || {} || ' ', ' ' || ? || ' ') > 0)".format(value),
+        "(instr({} || ' ', ? || ' ') = 1)".format(value),
+        "({} = ?)".format(value),
+    ]
+
+
+def _match_score_params(word):
+    # For the terms of both the name and the artists' names
+    return 2 * [word, word, word, word, word, word]
+
+
+def _fts_query(words, prefix):
+    """
+    Build an FTS5 query matching rows having, for each word, a token starting
+    with it (`prefix`) or equal to it. Words without any character that could
+    be part of a token are ignored. Return None if no word is left.
+    """
+    terms = [
+        '"{}"{}'.format(w.replace('"', '""'), '*' if prefix else '')
+        for w in words
+        if re.search(r'\w', w)
+    ]
+    if not terms:
+        return None
+    return ' '.join(terms)
+
+
+def _casefold(value):
+    return None if value is None else value.casefold()
+
+
+# Lowest maximum number of host parameters in a statement across the SQLite
+# versions supported (SQLITE_MAX_VARIABLE_NUMBER before 3.32.0)
+SQL_MAX_VARIABLES = 999
+
+
 def _pypika_params(n):
+    from pypika import Parameter
     return [Parameter('?') for _ in range(n)]
 
 
+# Statements only depend on the table and the columns involved, so their SQL
+# is built once with pypika and then reused. This also lets the sqlite3
+# module reuse its own prepared statements. pypika is imported by the
+# builders, so that commands which don't build statements don't load it.
+
+@functools.lru_cache(maxsize=None)
+def _insert_statement(table_name, columns):
+    from pypika import Query
+    return str(
+        Query.into(table_name)
+        .columns(*columns)
+        .insert(*_pypika_params(len(columns)))
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _insert_on_conflict_statement(table_name, columns, conflict_column, action):
+    """
+    `action` is either 'update' (the values are to be given twice, once for
+    the insert and once for the update) or 'nothing'
+    """
+    from pypika import PostgreSQLQuery, Parameter
+    q = (
+        PostgreSQLQuery.into(table_name)
+        .columns(*columns)
+        .insert(*_pypika_params(len(columns)))
+        .on_conflict(conflict_column)
+    )
+    if action == 'update':
+        for column in columns:
+            q = q.do_update(column, Parameter('?'))
+    else:
+        q = q.do_nothing()
+    return str(q)
+
+
+@functools.lru_cache(maxsize=None)
+def _select_statement(table_name, columns, selector_columns, order_by):
+    from pypika import Query, Parameter, Table
+    table = Table(table_name)
+    q = Query.from_(table).select(*columns)
+    for col in selector_columns:
+        q = q.where(getattr(table, col) == Parameter('?'))
+    if order_by is not None:
+        q = q.orderby(order_by)
+    return str(q)
+
+
+@functools.lru_cache(maxsize=None)
+def _select_in_statement(table_name, column, nb_values):
+    from pypika import Query, Table
+    table = Table(table_name)
+    return str(
+        Query.from_(table)
+        .select(column)
+        .where(getattr(table, column).isin(_pypika_params(nb_values)))
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _select_latest_ids_statement(table_name):
+    return """
+        SELECT `spotify_id` FROM `{table}` ORDER BY `rowid` DESC LIMIT ?
+    """.format(table=table_name)
+
+
+@functools.lru_cache(maxsize=None)
+def _delete_statement(table_name, selector_columns):
+    from pypika import Query, Parameter, Table
+    table = Table(table_name)
+    q = Query.from_(table).delete()
+    for col in selector_columns:
+        q = q.where(getattr(table, col) == Parameter('?'))
+    return str(q)
+
+
 # Database version management
 
 def _get_database_version():
@@ -389,12 +1321,172 @@ V1_0_STATEMENTS = [
 ]
 
 
-SQL_INIT_STATEMENTS = V1_0_STATEMENTS
+# Count the listenings of the database into the (empty) aggregate tables
+AGGREGATES_BACKFILL_STATEMENTS = [
+    """
+    INSERT INTO `ListeningsByDay` (`day`, `play_count`)
+    SELECT substr(`played_at`, 1, 10), count(*) FROM `Listening`
+    GROUP BY substr(`played_at`, 1, 10);
+    """,
+    """
+    INSERT INTO `ListeningsByHour` (`hour`, `play_count`)
+    SELECT substr(`played_at`, 12, 2), count(*) FROM `Listening`
+    GROUP BY substr(`played_at`, 12, 2);
+    """,
+    """
+    INSERT INTO `ListeningsBySong` (`song_id`, `play_count`)
+    SELECT `song_id`, count(*) FROM `Listening`
+    GROUP BY `song_id`;
+    """,
+    """
+    INSERT INTO `ListeningsByArtist` (`artist_id`, `play_count`)
+    SELECT `SongByArtist`.`artist_id`, count(*) FROM `Listening`
+    JOIN `SongByArtist` ON `SongByArtist`.`song_id` = `Listening`.`song_id`
+    GROUP BY `SongByArtist`.`artist_id`;
+    """,
+]
+
+
+V1_4_STATEMENTS = [
+    """
+    ALTER TABLE `Playlist` ADD COLUMN `snapshot_id` TEXT;
+    """,
+    # Full-text index of songs, for the search. The index doesn't duplicate
+    # the names, it refers to the rows of the Song table, and is kept in sync
+    # with it by the triggers below.
+    """
+    CREATE VIRTUAL TABLE `SongSearch` USING fts5(
+        `name`,
+        `artists_names`,
+        content='Song',
+        content_rowid='rowid',
+        prefix='1 2 3'
+    );
+    """,
+    """
+    CREATE TRIGGER `SongSearchInsert` AFTER INSERT ON `Song` BEGIN
+        INSERT INTO `SongSearch` (`rowid`, `name`, `artists_names`)
+        VALUES (new.`rowid`, new.`name`, new.`artists_names`);
+    END;
+    """,
+    """
+    CREATE TRIGGER `SongSearchDelete` AFTER DELETE ON `Song` BEGIN
+        INSERT INTO `SongSearch` (`SongSearch`, `rowid`, `name`, `artists_names`)
+        VALUES ('delete', old.`rowid`, old.`name`, old.`artists_names`);
+    END;
+    """,
+    """
+    CREATE TRIGGER `SongSearchUpdate`
+    AFTER UPDATE OF `name`, `artists_names` ON `Song` BEGIN
+        INSERT INTO `SongSearch` (`SongSearch`, `rowid`, `name`, `artists_names`)
+        VALUES ('delete', old.`rowid`, old.`name`, old.`artists_names`);
+        INSERT INTO `SongSearch` (`rowid`, `name`, `artists_names`)
+        VALUES (new.`rowid`, new.`name`, new.`artists_names`);
+    END;
+    """,
+    """
+    INSERT INTO `SongSearch` (`SongSearch`) VALUES ('rebuild');
+    """,
+    # Listening counts aggregated by day, hour of the day, song and artist,
+    # maintained by pull_listenings (see update_listenings_aggregates)
+    """
+    CREATE TABLE `ListeningsByDay` (
+        `day`        TEXT PRIMARY KEY,
+        `play_count` INTEGER NOT NULL
+    );
+    """,
+    """
+    CREATE INDEX `DayPlayCountIx` ON `ListeningsByDay` (`play_count`);
+    """,
+    """
+    CREATE TABLE `ListeningsByHour` (
+        `hour`       TEXT PRIMARY KEY,
+        `play_count` INTEGER NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE `ListeningsBySong` (
+        `song_id`    TEXT PRIMARY KEY,
+        `play_count` INTEGER NOT NULL,
+
+        FOREIGN KEY(song_id) REFERENCES Song(spotify_id)
+    );
+    """,
+    """
+    CREATE INDEX `SongPlayCountIx` ON `ListeningsBySong` (`play_count`);
+    """,
+    """
+    CREATE TABLE `ListeningsByArtist` (
+        `artist_id`  TEXT PRIMARY KEY,
+        `play_count` INTEGER NOT NULL,
+
+        FOREIGN KEY(artist_id) REFERENCES Artist(spotify_id)
+    );
+    """,
+    """
+    CREATE INDEX `ArtistPlayCountIx` ON `ListeningsByArtist` (`play_count`);
+    """,
+    # Indexes of the reports of `statify stats` (see stats.REPORTS)
+    """
+    CREATE INDEX `ListeningPlayedAtIx` ON `Listening` (`played_at`);
+    """,
+    """
+    CREATE INDEX `ListeningContextAlbumIx`
+    ON `Listening` (`context`, `album_id`);
+    """,
+    """
+    CREATE INDEX `SongPopularityIx` ON `Song` (`popularity`);
+    """,
+    *AGGREGATES_BACKFILL_STATEMENTS,
+    # Resolution of the songs of data exports by name
+    """
+    CREATE INDEX `SongNameIx` ON `Song` (`name`);
+    """,
+    # Order of the tracks in playlists, and history of their changes
+    """
+    ALTER TABLE `SongInPlaylist` ADD COLUMN `position` INTEGER;
+    """,
+    """
+    CREATE INDEX `PlaylistPositionIx`
+    ON `SongInPlaylist` (`playlist_id`, `position`);
+    """,
+    """
+    CREATE TABLE `PlaylistEdit` (
+        `playlist_id` TEXT,
+        `date`        TEXT,
+        `operation`   TEXT,     -- 'insert' or 'delete'
+        `song_id`     TEXT,
+        `position`    INTEGER,  -- index in the playlist (before a delete)
+
+        FOREIGN KEY(playlist_id) REFERENCES Playlist(spotify_id),
+        FOREIGN KEY(song_id) REFERENCES Song(spotify_id)
+    );
+    """,
+    """
+    CREATE INDEX `PlaylistEditIx` ON `PlaylistEdit` (`playlist_id`, `date`);
+    """,
+    # High-water mark of the listenings, recorded by each retrieval
+    """
+    ALTER TABLE `ListeningsRetrieval` ADD COLUMN `to_played_at` TEXT;
+    """,
+    # Hole in the history found by a retrieval: the listenings between these
+    # two played_at couldn't be retrieved
+    """
+    ALTER TABLE `ListeningsRetrieval` ADD COLUMN `gap_from` TEXT;
+    """,
+    """
+    ALTER TABLE `ListeningsRetrieval` ADD COLUMN `gap_to` TEXT;
+    """,
+]
+
+
+SQL_INIT_STATEMENTS = V1_0_STATEMENTS + V1_4_STATEMENTS
 
 
 # {version_number: index of the last SQL statement for this version}
 SQL_INIT_VERSIONS = {
     '1.0': len(V1_0_STATEMENTS),
+    '1.4': len(V1_0_STATEMENTS) + len(V1_4_STATEMENTS),
 }
 
 
@@ -402,15 +1494,33 @@ def _get_database_updates(from_version):
     if from_version is None:
         from_index = 0
     else:
-        # Finding the highest version lesser or equal to the found version
-        registered_versions = sorted(
-            SQL_INIT_VERSIONS.keys(),
-            key=lambda v: LooseVersion(v),
-            reverse=True,
-        )
-        for version in registered_versions:
-            if LooseVersion(version) <= LooseVersion(config.VERSION):
-                from_version = version
-                break
-        from_index = SQL_INIT_VERSIONS[from_version]
-    return SQL_INIT_STATEMENTS[from_index:]
+        from_index = SQL_INIT_VERSIONS[_get_registered_version(from_version)]
+    to_index = SQL_INIT_VERSIONS[_get_registered_version(config.VERSION)]
+    return SQL_INIT_STATEMENTS[from_index:to_index]
+
+
+def _parse_version(version):
+    """
+    Return a tuple of the numbers of a version like '1.4.0', comparable with
+    the tuples of other versions. Trailing zeros are dropped so that '1.4'
+    and '1.4.0' are equal.
+    """
+    numbers = [int(number) for number in re.findall(r'\d+', version)]
+    while numbers and numbers[-1] == 0:
+        numbers.pop()
+    return tuple(numbers)
+
+
+def _get_registered_version(version):
+    """
+    Return the highest registered version lesser or equal to the given one
+    """
+    registered_versions = sorted(
+        SQL_INIT_VERSIONS.keys(),
+        key=_parse_version,
+        reverse=True,
+    )
+    for registered_version in registered_versions:
+        if _parse_version(registered_version) <= _parse_version(version):
+            return registered_version
+    return registered_versions[-1]
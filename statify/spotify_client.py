@@ -1,8 +1,14 @@
 import binascii
+import collections
+import threading
 import time
 import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
 import spotipy
+import urllib3
 
 from . import config
 
@@ -14,20 +20,51 @@ SCOPES = [
 ]
 OAUTH_TOKENS_PATH = config.STATIFY_PATH / 'oauth_tokens.json'
 
+# Status codes retried by the HTTP session itself. 429 is left out so that
+# rate limiting is handled by the client's rate limiter.
+RETRIED_STATUS_CODES = (500, 502, 503, 504)
+
+# Maximum number of IDs accepted by the several-IDs endpoints
+TRACKS_BATCH_SIZE = 50
+ALBUMS_BATCH_SIZE = 20
+ARTISTS_BATCH_SIZE = 50
+
+# Access tokens are refreshed this many seconds before they expire, so that
+# no call is made with an expired token
+TOKEN_REFRESH_MARGIN = 300
+
+# Default size of the HTTP connection pool (same as requests' default)
+DEFAULT_POOL_SIZE = 10
+
 
 class Spotify:
 
     def __init__(
         self, client_id, client_secret, track_transformer=None, throttling=0.5,
-        **client_args,
+        max_rate=None, max_retries=5, concurrency=1, pool_size=None,
+        http_retries=3, **client_args,
     ):
-        # Note: Spotify rate limit is not documented. The proper way to deal
-        # with it is to look at the `Retry-After` HTTP header, but here we use
-        # throttling with a fixed waiting time for simplicity.
+        # Note: Spotify rate limit is not documented. Calls are spaced by
+        # `throttling` seconds at first, then the rate increases while calls
+        # succeed (up to `max_rate` calls per second) and decreases when the
+        # API answers with a 429, in which case the `Retry-After` HTTP header
+        # is honored. The rate limiter is shared by all the threads using the
+        # client, so that raising `concurrency` doesn't exceed the rate.
 
         self.client_id = client_id
         self.client_secret = client_secret
         self.track_transformer = track_transformer
+        self.concurrency = concurrency
+
+        # A single HTTP session (and so connection pool) is used for all the
+        # calls, including the OAuth ones. With concurrency, each playlist
+        # fetched at once can prefetch as many pages at once.
+        if pool_size is None:
+            pool_size = max(
+                DEFAULT_POOL_SIZE, concurrency * (concurrency + 1),
+            )
+        self.session = build_session(pool_size, http_retries)
+        self._client_args = client_args
 
         self.oauth_manager = spotipy.oauth2.SpotifyOAuth(
             client_id=self.client_id,
@@ -37,59 +74,158 @@ class Spotify:
             redirect_uri=REDIRECT_URI,
             state=random_string(16),
             open_browser=False,
+            requests_session=self.session,
         )
+        # Tokens are read from the cache file once, then kept in memory by
+        # the token manager, which refreshes them as needed
         tokens_resource = self.oauth_manager.get_cached_token()
         if tokens_resource is None:
-            self.token = None
+            self.token_manager = None
             self.sp = None
         else:
-            self.token = tokens_resource['access_token']
-            self.sp = spotipy.client.Spotify(self.token, **client_args)
+            self.token_manager = TokenManager(
+                self.oauth_manager, tokens_resource,
+            )
+            self.sp = self._make_client()
 
         # Throttling
-        self._last_call_time = 0
-        self._throttling = throttling
+        self.max_retries = max_retries
+        self.rate_limiter = AdaptiveRateLimiter(
+            rate=(1 / throttling) if throttling else None,
+            max_rate=max_rate,
+        )
 
     def authenticate_user(self, headless=False):
         code = self.oauth_manager.get_auth_response(open_browser=(not headless))
-        self.token = self.oauth_manager.get_access_token(code, as_dict=False)
-        self.sp = spotipy.client.Spotify(self.token)
+        self.oauth_manager.get_access_token(code, as_dict=False)
+        self.token_manager = TokenManager(
+            self.oauth_manager, self.oauth_manager.get_cached_token(),
+        )
+        self.sp = self._make_client()
+
+    def _make_client(self):
+        return spotipy.client.Spotify(
+            auth_manager=self.token_manager,
+            requests_session=self.session,
+            **self._client_args,
+        )
+
+    def close(self):
+        self.session.close()
 
     def is_user_authenticated(self):
-        return self.token is not None
+        return self.token_manager is not None
 
     def _check_user_authenticated(self):
         if not self.is_user_authenticated():
             raise Exception("User is not authenticated")
 
-    def _throttle(self):
-        time_passed = time.time() - self._last_call_time
-        if time_passed < self._throttling:
-            time.sleep(self._throttling - time_passed)
-        self._last_call_time = time.time()
+    def metrics(self):
+        return self.rate_limiter.metrics()
+
+    def _call(self, method, *args, **kwargs):
+        """
+        Call the spotipy method once the rate limiter allows it, retrying it
+        when rate limited by the API, or once with refreshed tokens when the
+        API rejects the access token
+        """
+        attempt = 0
+        refreshed = False
+        while True:
+            self.rate_limiter.acquire()
+            access_token = self.token_manager.access_token
+            try:
+                result = method(*args, **kwargs)
+            except spotipy.SpotifyException as err:
+                if err.http_status == 401 and not refreshed:
+                    self.token_manager.refresh(access_token)
+                    refreshed = True
+                    continue
+                if err.http_status != 429:
+                    raise
+                self.rate_limiter.rate_limited(
+                    parse_retry_after(err.headers.get('Retry-After'))
+                )
+                if attempt >= self.max_retries:
+                    raise
+                self.rate_limiter.retrying()
+                attempt += 1
+            else:
+                self.rate_limiter.succeeded()
+                return result
 
     def _paginate_spotipy_method(self, method, *args, page_size=50, **kwargs):
-        retrieved = 0
-        total = None
-        page = 0
-        while total is None or retrieved < total:
-            self._throttle()
-            paginated_resource = method(
-                *args,
-                limit=page_size,
-                offset=page*page_size,
-                **kwargs,
+        """
+        Yield the items of all the pages of an offset-paginated method. Once
+        the first page gives the total number of items, the remaining pages
+        are fetched concurrently if the client's concurrency allows it, or
+        else by following the `next` URLs given by the API.
+        """
+        paginated_resource = self._call(
+            method,
+            *args,
+            limit=page_size,
+            offset=0,
+            **kwargs,
+        )
+        yield from paginated_resource['items']
+
+        offsets = range(page_size, paginated_resource['total'], page_size)
+        if self.concurrency > 1 and len(offsets) > 1:
+            yield from self._prefetch_pages(
+                method, *args, offsets=offsets, page_size=page_size, **kwargs,
             )
-            retrieved += len(paginated_resource['items'])
-            total = paginated_resource['total']
-            page += 1
-            for item in paginated_resource['items']:
-                yield item
+            return
+
+        for offset in offsets:
+            if 'next' in paginated_resource:
+                if paginated_resource['next'] is None:
+                    break
+                paginated_resource = self._call(
+                    self.sp.next, paginated_resource,
+                )
+            else:
+                paginated_resource = self._call(
+                    method,
+                    *args,
+                    limit=page_size,
+                    offset=offset,
+                    **kwargs,
+                )
+            yield from paginated_resource['items']
+
+    def _prefetch_pages(self, method, *args, offsets, page_size, **kwargs):
+        """
+        Fetch the pages at the given offsets from a thread pool, and yield
+        their items in order. At most twice the concurrency pages are
+        fetched ahead of the one being consumed.
+        """
+        offsets = iter(offsets)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            def submit_next():
+                offset = next(offsets, None)
+                if offset is not None:
+                    pending.append(executor.submit(
+                        self._call,
+                        method,
+                        *args,
+                        limit=page_size,
+                        offset=offset,
+                        **kwargs,
+                    ))
+
+            pending = collections.deque()
+            for _ in range(2 * self.concurrency):
+                submit_next()
+            while pending:
+                paginated_resource = pending.popleft().result()
+                submit_next()
+                yield from paginated_resource['items']
 
     def _paginate_bidirectional_spotipy_method(
-        self, method, *args, page_size=50, direction='before', **kwargs
+        self, method, *args, page_size=50, direction='before', cursor=None,
+        **kwargs
     ):
-        cursor = None
         over = None
         while not over:
             params = {
@@ -97,8 +233,7 @@ class Spotify:
                 direction: cursor,
                 **kwargs,
             }
-            self._throttle()
-            paginated_resource = method(*args, **params)
+            paginated_resource = self._call(method, *args, **params)
             for item in paginated_resource['items']:
                 yield item
             cursors = paginated_resource['cursors']
@@ -106,7 +241,13 @@ class Spotify:
                 new_cursor = cursors.get(direction)
             else:
                 new_cursor = None
-            if new_cursor is None or new_cursor == cursor:
+            # A partial page, or no next page, is the last one: no need to
+            # ask for an empty page
+            last_page = (
+                len(paginated_resource['items']) < page_size or
+                paginated_resource.get('next', '') is None
+            )
+            if last_page or new_cursor is None or new_cursor == cursor:
                 over = True
             else:
                 cursor = new_cursor
@@ -129,18 +270,238 @@ class Spotify:
                 p_track['track'] = self.track_transformer(p_track['track'])
             yield p_track
 
-    def current_user_recently_played(self):
+    def current_user_recently_played(self, after=None):
+        """
+        Yield the listenings of the user, from the newest, or only the ones
+        played after the given timestamp (in milliseconds), in no particular
+        order.
+        """
         self._check_user_authenticated()
         for listening in self._paginate_bidirectional_spotipy_method(
             self.sp.current_user_recently_played,
             page_size=50,  # Max allowed
+            direction='before' if after is None else 'after',
+            cursor=after,
         ):
             if self.track_transformer is not None:
                 listening['track'] = self.track_transformer(listening['track'])
             yield listening
 
+    def tracks(self, ids):
+        """
+        Yield the tracks of the given IDs, None for the unknown ones, fetched
+        by batches of TRACKS_BATCH_SIZE
+        """
+        for track in self._fetch_several(
+            self.sp.tracks, 'tracks', ids, TRACKS_BATCH_SIZE,
+        ):
+            if track is not None and self.track_transformer is not None:
+                track = self.track_transformer(track)
+            yield track
+
+    def albums(self, ids):
+        return self._fetch_several(
+            self.sp.albums, 'albums', ids, ALBUMS_BATCH_SIZE,
+        )
+
+    def artists(self, ids):
+        return self._fetch_several(
+            self.sp.artists, 'artists', ids, ARTISTS_BATCH_SIZE,
+        )
+
+    def _fetch_several(self, method, key, ids, batch_size):
+        self._check_user_authenticated()
+        ids = list(ids)
+        for i in range(0, len(ids), batch_size):
+            yield from self._call(method, ids[i:i+batch_size])[key]
+
+
+class TokenManager:
+    """
+    Auth manager of the spotipy client, keeping the tokens in memory. The
+    access token is refreshed `refresh_margin` seconds before it expires, or
+    when the API rejects it, and the new tokens are saved in the cache file
+    by the OAuth manager. Thread-safe: when several threads find the access
+    token expired, only one of them refreshes it.
+    """
+
+    def __init__(
+        self, oauth_manager, token_info, refresh_margin=TOKEN_REFRESH_MARGIN,
+    ):
+        self.oauth_manager = oauth_manager
+        self.token_info = token_info
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+
+    @property
+    def access_token(self):
+        return self.token_info['access_token']
+
+    def get_access_token(self, as_dict=False):
+        with self._lock:
+            if self.token_info['expires_at'] - time.time() < self.refresh_margin:
+                self._refresh()
+            return self.token_info if as_dict else self.access_token
+
+    def refresh(self, rejected_token):
+        """
+        Refresh the tokens, unless the rejected access token has already been
+        replaced by another thread
+        """
+        with self._lock:
+            if self.access_token == rejected_token:
+                self._refresh()
+
+    def _refresh(self):
+        self.token_info = self.oauth_manager.refresh_access_token(
+            self.token_info['refresh_token'],
+        )
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket. Tokens are refilled at `rate` per second, up to
+    `burst` tokens, and each call to `acquire` consumes one token, waiting for
+    it if needed. A `rate` of None disables the limiting.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._last_refill) * self.rate,
+            )
+            self._last_refill = now
+            # The token is reserved even if it's not available yet, so that
+            # waiting threads are served in order without holding the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    Rate limiter whose rate additively increases with each successful call,
+    up to `max_rate`, and is halved when the API rate limits us (down to
+    `min_rate`). After a rate limiting, no call is allowed before the delay
+    asked by the API.
+    """
+
+    def __init__(
+        self, rate, max_rate=None, min_rate=None, rate_increase=0.05, burst=1,
+    ):
+        super().__init__(rate, burst=burst)
+        if rate is not None:
+            self.max_rate = max_rate if max_rate is not None else 4 * rate
+            self.min_rate = min_rate if min_rate is not None else rate / 8
+        else:
+            self.max_rate = self.min_rate = None
+        self.rate_increase = rate_increase
+        self.nb_calls = 0
+        self.nb_rate_limited = 0
+        self.nb_retries = 0
+        self._not_before = 0
+
+    def acquire(self):
+        with self._lock:
+            wait = self._not_before - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        super().acquire()
+
+    def succeeded(self):
+        with self._lock:
+            self.nb_calls += 1
+            if self.rate is not None:
+                self.rate = min(self.max_rate, self.rate + self.rate_increase)
+
+    def rate_limited(self, retry_after):
+        with self._lock:
+            self.nb_calls += 1
+            self.nb_rate_limited += 1
+            self._not_before = max(
+                self._not_before, time.monotonic() + retry_after,
+            )
+            if self.rate is not None:
+                self.rate = max(self.min_rate, self.rate / 2)
+                # Dropping the tokens accumulated at the previous rate
+                self._tokens = min(self._tokens, 0)
+
+    def retrying(self):
+        with self._lock:
+            self.nb_retries += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'nb_calls': self.nb_calls,
+                'nb_rate_limited': self.nb_rate_limited,
+                'nb_retries': self.nb_retries,
+            }
+
 
 # Utils
 
+def build_session(pool_size, retries, backoff_factor=0.3):
+    """
+    Build an HTTP session keeping up to `pool_size` connections alive to the
+    Spotify API, with TCP keep-alive so that idle connections survive long
+    pauses, and retrying on connection errors and server errors.
+    """
+    session = requests.Session()
+    retry = urllib3.Retry(
+        total=retries,
+        connect=None,
+        read=False,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRIED_STATUS_CODES,
+        # Otherwise urllib3 retries any 429 with a Retry-After header itself,
+        # hiding it from the rate limiter
+        respect_retry_after_header=False,
+    )
+    adapter = KeepAliveHTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class KeepAliveHTTPAdapter(requests.adapters.HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = (
+            urllib3.connection.HTTPConnection.default_socket_options +
+            [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        )
+        super().init_poolmanager(*args, **kwargs)
+
+
+def parse_retry_after(value, default=1):
+    """
+    Return the number of seconds to wait according to a `Retry-After` header
+    value (only the delay-seconds form is used by Spotify)
+    """
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
 def random_string(nb_bytes):
     return binascii.hexlify(os.urandom(nb_bytes)).decode('utf8')
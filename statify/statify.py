@@ -1,15 +1,22 @@
 import argparse
+import collections
+import datetime
 import hashlib
+import itertools
+import json
 import logging
 import os.path
+import queue
+import sched
 import sys
-
-import yaml
-from pypika import Query, Order
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from . import config
+from . import data_import
 from . import database_client
-from . import spotify_client
+from . import stats
 
 
 __version__ = config.VERSION
@@ -17,6 +24,25 @@ __version__ = config.VERSION
 
 DEFAULT_LOGGING_FILE = config.STATIFY_PATH / 'statify.log'
 
+# Progress of an interrupted pull of playlists
+CHECKPOINT_PATH = config.STATIFY_PATH / 'pull_checkpoint.json'
+
+# Tracks of a playlist are synced by pages of this size
+PLAYLIST_PAGE_SIZE = 100
+
+# Maximum number of pages buffered by each concurrent fetch of a playlist
+PAGES_BUFFER_SIZE = 4
+
+# Bounds of the adaptive interval between two pulls of listenings of the
+# daemon, and interval between two pulls of playlists, in seconds
+DAEMON_MIN_INTERVAL = 300
+DAEMON_MAX_INTERVAL = 3600
+DAEMON_PLAYLISTS_INTERVAL = 6 * 3600
+
+# Number of new listenings each pull of the daemon aims at, well below the 50
+# listenings of the recently played history
+DAEMON_TARGET_LISTENINGS = 20
+
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +57,19 @@ def main():
     auth_parser = subparsers.add_parser('auth')
     auth_parser.add_argument('--headless', action='store_true')
 
+    import_parser = subparsers.add_parser('import')
+    import_parser.add_argument('directory')
+
+    subparsers.add_parser('daemon')
+
+    stats_parser = subparsers.add_parser('stats')
+    stats_parser.add_argument(
+        'what', nargs='?', choices=[report.name for report in stats.REPORTS],
+    )
+    stats_parser.add_argument('--limit', type=int, default=20)
+    stats_parser.add_argument('--format', choices=stats.FORMATS, default='text')
+    stats_parser.add_argument('--output')
+
     args = parser.parse_args()
 
     code = _main(args)
@@ -64,20 +103,11 @@ def _main(args):
         logfile_path = str(DEFAULT_LOGGING_FILE)
     setup_logging(filepath=logfile_path)
 
-    # Spotify client
-    spotify_client_args = {
-        'client_id': conf['spotify_app']['client_id'],
-        'client_secret': conf['spotify_app']['client_secret'],
-        'track_transformer': idify_local_track,
-    }
-    if conf.get('throttling') is not None:
-        spotify_client_args['throttling'] = conf.get('throttling')
-    spotify_client_args.update(conf.get('client_args', {}))
-    spotify = spotify_client.Spotify(**spotify_client_args)
-
     # Database client
     try:
-        database = database_client.StatifyDatabase()
+        database = database_client.StatifyDatabase(
+            pragmas=conf.get('database', {}).get(database_client.WRITER),
+        )
     except database_client.DowngradeVersionError as err:
         print(
             "Statify version {} is running but the database is setup for "
@@ -90,30 +120,190 @@ def _main(args):
         )
         return 1
 
+    # Spotify client, only for the commands calling the API
+    spotify = None
+    if args.command in ['auth', 'pull', 'daemon']:
+        spotify = get_spotify_client(conf)
+
     # Argument dispatching
-    if args.command == 'auth':
-        spotify.authenticate_user(args.headless)
-    elif args.command == 'pull':
-        if not spotify.is_user_authenticated():
-            print("User not authenticated. Authenticate with `statify auth`")
-        else:
-            if args.what in ['playlists', 'all']:
-                pull_playlists(spotify, database)
-            if args.what in ['listenings', 'all']:
-                pull_listenings(spotify, database)
+    try:
+        if args.command == 'auth':
+            spotify.authenticate_user(args.headless)
+        elif args.command == 'pull':
+            if not spotify.is_user_authenticated():
+                print("User not authenticated. Authenticate with `statify auth`")
+            else:
+                if args.what in ['playlists', 'all']:
+                    pull_playlists(spotify, database, **get_commits_config(conf))
+                if args.what in ['listenings', 'all']:
+                    pull_listenings(spotify, database)
+                if args.what == 'metadata':
+                    pull_metadata(spotify, database)
+                logger.debug("Spotify API metrics: %s", spotify.metrics())
+        elif args.command == 'daemon':
+            if not spotify.is_user_authenticated():
+                print("User not authenticated. Authenticate with `statify auth`")
+                return 1
+            logger.info("Starting daemon")
+            try:
+                run_daemon(
+                    spotify, database, get_commits_config(conf),
+                    **conf.get('daemon', {}),
+                )
+            except KeyboardInterrupt:
+                logger.info("Daemon stopped")
+        elif args.command == 'stats':
+            print_stats(database, args)
+        elif args.command == 'import':
+            counts = data_import.import_listenings(
+                database, args.directory, **get_commits_config(conf),
+            )
+            logger.info(
+                "Imported %s listenings out of %s (%s already known, %s too "
+                "short, %s of unknown songs)",
+                counts['imported'], counts['read'], counts['known'],
+                counts['short'], counts['unresolved'],
+            )
+    finally:
+        # Releases the connections kept alive by the HTTP session
+        if spotify is not None:
+            spotify.close()
+
+
+def print_stats(database, args):
+    if args.what is None:
+        for report in stats.REPORTS:
+            print('{:<10} {}'.format(report.name, report.description))
+        return
+    report = stats.CATALOG[args.what]
+    rows = stats.run_report(database, report.name, args.limit)
+    if args.output is None:
+        stats.export_report(report, rows, sys.stdout, args.format)
+    else:
+        with open(args.output, 'w', newline='') as output_file:
+            stats.export_report(report, rows, output_file, args.format)
+
+
+def run_daemon(
+    spotify, database, commits_config,
+    min_interval=DAEMON_MIN_INTERVAL,
+    max_interval=DAEMON_MAX_INTERVAL,
+    playlists_interval=DAEMON_PLAYLISTS_INTERVAL,
+    timefunc=time.monotonic,
+    delayfunc=time.sleep,
+):
+    """
+    Pull listenings and playlists forever with the same clients. Listenings
+    are pulled at an interval adapted to the number of new listenings of the
+    previous pull, playlists at a fixed interval. A failed pull is logged
+    and retried at its next run.
+    """
+    scheduler = sched.scheduler(timefunc, delayfunc)
 
+    def pull_listenings_job(interval):
+        new_listenings = run_daemon_job(
+            database, pull_listenings, spotify, database,
+        )
+        if new_listenings is not None:
+            interval = next_listenings_interval(
+                interval, new_listenings, min_interval, max_interval,
+            )
+        logger.debug("Next pull of listenings in %s seconds", interval)
+        scheduler.enter(interval, 1, pull_listenings_job, (interval,))
 
-def get_config():
-    if os.path.exists(str(config.CONFIG_PATH)):
-        with open(str(config.CONFIG_PATH)) as config_file:
-            conf = yaml.safe_load(config_file)
-        if any(
-            conf.get('spotify_app', {}).get(key) is None for key in [
-                'client_id', 'client_secret',
-            ]
-        ):
-            conf = None
+    def pull_playlists_job():
+        run_daemon_job(
+            database, pull_playlists, spotify, database, **commits_config
+        )
+        scheduler.enter(playlists_interval, 2, pull_playlists_job)
+
+    scheduler.enter(0, 1, pull_listenings_job, (min_interval,))
+    scheduler.enter(0, 2, pull_playlists_job)
+    scheduler.run()
+
+
+def run_daemon_job(database, pull, *args, **kwargs):
+    try:
+        return pull(*args, **kwargs)
+    except Exception:
+        logger.exception("%s failed", pull.__name__)
+        database.rollback()
+        return None
+
+
+def next_listenings_interval(
+    interval, new_listenings, min_interval, max_interval
+):
+    """
+    Scale the interval so that the next pull brings about
+    DAEMON_TARGET_LISTENINGS listenings, assuming the same listening pace
+    """
+    if new_listenings == 0:
+        interval = 2 * interval
     else:
+        interval = interval * DAEMON_TARGET_LISTENINGS / new_listenings
+    return max(min_interval, min(max_interval, interval))
+
+
+def load_checkpoint():
+    try:
+        with open(str(CHECKPOINT_PATH)) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(checkpoint):
+    """
+    Replace the checkpoint file atomically, so that a crash leaves either the
+    previous checkpoint or the new one
+    """
+    temporary_path = str(CHECKPOINT_PATH) + '.tmp'
+    with open(temporary_path, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, str(CHECKPOINT_PATH))
+
+
+def clear_checkpoint():
+    if os.path.exists(str(CHECKPOINT_PATH)):
+        os.remove(str(CHECKPOINT_PATH))
+
+
+def get_spotify_client(conf):
+    # spotipy and requests are slow to import, so they're only loaded here
+    from . import spotify_client
+
+    spotify_client_args = {
+        'client_id': conf['spotify_app']['client_id'],
+        'client_secret': conf['spotify_app']['client_secret'],
+        'track_transformer': idify_local_track,
+    }
+    for key in [
+        'throttling', 'max_rate', 'concurrency', 'pool_size', 'http_retries',
+    ]:
+        if conf.get(key) is not None:
+            spotify_client_args[key] = conf.get(key)
+    spotify_client_args.update(conf.get('client_args', {}))
+    return spotify_client.Spotify(**spotify_client_args)
+
+
+def get_commits_config(conf):
+    return {
+        key: conf[key]
+        for key in ['commit_every_rows', 'commit_every_seconds']
+        if conf.get(key) is not None
+    }
+
+
+def get_config():
+    conf = config.load_config()
+    if conf is not None and any(
+        conf.get('spotify_app', {}).get(key) is None for key in [
+            'client_id', 'client_secret',
+        ]
+    ):
         conf = None
     return conf
 
@@ -161,130 +351,389 @@ def denormalize_artists(resource):
     return ', '.join(sorted([a['name'] for a in resource['artists']]))
 
 
-def pull_playlists(spotify, database):
-    playlists = spotify.current_user_playlists()
-    for playlist_resource in playlists:
-        playlist_obj = playlist_from_resource(playlist_resource)
+def pull_playlists(
+    spotify, database,
+    commit_every_rows=database_client.COMMIT_EVERY_ROWS,
+    commit_every_seconds=database_client.COMMIT_EVERY_SECONDS,
+):
+    """
+    Pull the playlists and the tracks of the changed ones. Writes are
+    committed in batches, and each commit saves a checkpoint of the synced
+    playlists: an interrupted pull resumes without syncing them again.
+    """
+    checkpoint = load_checkpoint()
+    synced_playlists = set(checkpoint.get('synced_playlists', []))
+    if synced_playlists:
+        logger.info(
+            "Resuming interrupted pull, %s playlists already synced",
+            len(synced_playlists),
+        )
+    commits = database_client.BatchedCommits(
+        database,
+        every_rows=commit_every_rows,
+        every_seconds=commit_every_seconds,
+        on_commit=lambda: save_checkpoint({
+            'synced_playlists': sorted(synced_playlists),
+        }),
+    )
+
+    playlists = [
+        playlist_from_resource(playlist_resource)
+        for playlist_resource in spotify.current_user_playlists()
+    ]
+    saved_snapshots = {
+        row['spotify_id']: row['snapshot_id']
+        for row in database.select_from(
+            'Playlist', ['spotify_id', 'snapshot_id'],
+        )
+    }
+
+    # Playlists whose snapshot didn't change since the last pull have the
+    # same tracks, so only their metadata is updated
+    changed_playlists = []
+    for playlist_obj in playlists:
+        saved_snapshot = saved_snapshots.get(playlist_obj.spotify_id)
+        if playlist_obj.spotify_id in synced_playlists:
+            continue
+        elif (
+            playlist_obj.snapshot_id is not None and
+            playlist_obj.snapshot_id == saved_snapshot
+        ):
+            logger.debug(
+                "Unchanged playlist: %s (%s)",
+                playlist_obj.spotify_id,
+                playlist_obj.name,
+            )
+            database.insert_or_update(playlist_obj, 'spotify_id')
+            commits.add()
+        else:
+            changed_playlists.append(playlist_obj)
+
+    for playlist_obj, pages in fetch_playlists_tracks(
+        spotify, changed_playlists
+    ):
+        nb_changes = sync_playlist_tracks(database, playlist_obj, pages)
+        # The playlist (and so its snapshot) is saved along with its tracks,
+        # so that an interrupted pull doesn't skip it next time
         database.insert_or_update(playlist_obj, 'spotify_id')
-        database.commit()
-
-        # Syncing playlist tracks
-        spotify_tracks = list(spotify.playlist_tracks(playlist_obj.spotify_id))
-        spotify_tracks_ids = set(t['track']['id'] for t in spotify_tracks)
-        saved_tracks_ids = set(
-            row[0] for row in database.select_from(
-                'SongInPlaylist',
-                ['song_id'],
-                playlist_id=playlist_obj.spotify_id,
+        synced_playlists.add(playlist_obj.spotify_id)
+        commits.add(nb_changes + 1)
+
+    commits.commit()
+    clear_checkpoint()
+
+
+def fetch_playlists_tracks(spotify, playlists):
+    """
+    Yield (playlist, pages) pairs, in the order of the given playlists, where
+    `pages` yields the tracks of the playlist by lists of at most
+    PLAYLIST_PAGE_SIZE, as they're fetched. The pages of a pair must be
+    consumed before moving to the next pair.
+
+    When the client's concurrency is greater than 1, the tracks of several
+    playlists are fetched at once from a thread pool, each fetch buffering
+    at most PAGES_BUFFER_SIZE pages, while the database writes stay in the
+    consuming thread. Fetches are submitted as the playlists are consumed,
+    so that an error stops the pull after the fetches in progress.
+    """
+    if spotify.concurrency <= 1:
+        for playlist_obj in playlists:
+            yield playlist_obj, iter_pages(
+                spotify.playlist_tracks(playlist_obj.spotify_id),
+                PLAYLIST_PAGE_SIZE,
             )
+        return
+
+    stop = threading.Event()
+
+    def put(pages_queue, item):
+        while not stop.is_set():
+            try:
+                pages_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch(playlist_obj, pages_queue):
+        if stop.is_set():
+            return
+        try:
+            for page in iter_pages(
+                spotify.playlist_tracks(playlist_obj.spotify_id),
+                PLAYLIST_PAGE_SIZE,
+            ):
+                if not put(pages_queue, page):
+                    return
+            put(pages_queue, None)
+        except Exception as e:
+            put(pages_queue, e)
+
+    def consume(pages_queue):
+        while True:
+            page = pages_queue.get()
+            if page is None:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+
+    playlists = iter(playlists)
+    with ThreadPoolExecutor(max_workers=spotify.concurrency) as executor:
+        def submit_next():
+            playlist_obj = next(playlists, None)
+            if playlist_obj is not None:
+                pages_queue = queue.Queue(maxsize=PAGES_BUFFER_SIZE)
+                executor.submit(fetch, playlist_obj, pages_queue)
+                pending.append((playlist_obj, pages_queue))
+
+        try:
+            pending = collections.deque()
+            for _ in range(spotify.concurrency):
+                submit_next()
+            while pending:
+                playlist_obj, pages_queue = pending.popleft()
+                yield playlist_obj, consume(pages_queue)
+                submit_next()
+        finally:
+            stop.set()
+
+
+def iter_pages(items, page_size):
+    items = iter(items)
+    while True:
+        page = list(itertools.islice(items, page_size))
+        if not page:
+            return
+        yield page
+
+
+def sync_playlist_tracks(database, playlist_obj, pages):
+    """
+    Stage the tracks of the playlist page by page, then apply the edits
+    between the saved tracks and the staged ones, positions included. Return
+    the number of added and removed tracks.
+    """
+    database.clear_staged_playlist_tracks()
+    for page in pages:
+        # First insert tracks if not existing
+        insert_songs(database, [track['track'] for track in page])
+        database.stage_playlist_tracks(
+            (track['track']['id'], track['added_at']) for track in page
         )
 
-        # Removing tracks in the database but not in Spotify
-        for track_id in saved_tracks_ids:
-            if track_id not in spotify_tracks_ids:
-                database.delete_from(
-                    'SongInPlaylist',
-                    song_id=track_id,
-                    playlist_id=playlist_obj.spotify_id,
-                )
-                logger.info(
-                    "Deleted song: %s in playlist %s (%s)",
-                    track_id,
-                    playlist_obj.spotify_id,
-                    playlist_obj.name,
-                )
-
-        # Adding tracks in spotify but not in the database
-        for track in spotify_tracks:
-            if track['track']['id'] not in saved_tracks_ids:
-                song_obj = song_from_resource(track['track'])
-                # First insert track if not existing (or update)
-                insert_song(database, track['track'])
-                # Then insert association between track and playlist
-                database.insert_into(
-                    'SongInPlaylist',
-                    song_id=song_obj.spotify_id,
-                    playlist_id=playlist_obj.spotify_id,
-                    added_at=track['added_at'],
-                )
-                logger.info(
-                    "Added song: %s (%s) in playlist %s (%s)",
-                    song_obj.spotify_id,
-                    song_obj.name,
-                    playlist_obj.spotify_id,
-                    playlist_obj.name,
-                )
-        database.commit()
+    removed_songs_ids, added_songs = database.apply_staged_playlist_tracks(
+        playlist_obj.spotify_id,
+    )
+    for song_id in removed_songs_ids:
+        logger.info(
+            "Deleted song: %s in playlist %s (%s)",
+            song_id,
+            playlist_obj.spotify_id,
+            playlist_obj.name,
+        )
+    for song_id, song_name in added_songs:
+        logger.info(
+            "Added song: %s (%s) in playlist %s (%s)",
+            song_id,
+            song_name,
+            playlist_obj.spotify_id,
+            playlist_obj.name,
+        )
+    return len(removed_songs_ids) + len(added_songs)
 
 
 def pull_listenings(spotify, database):
-    last_known_listening = database.query(
-        Query
-        .from_('Listening')
-        .select('played_at')
-        .orderby('played_at', order=Order.desc)
-        .limit(1)
-    ).fetchone()
-
-    if last_known_listening is None:
-        last_known_played_at = None
+    """
+    Retrieve the listenings newer than the last known one and record the
+    retrieval in ListeningsRetrieval, along with the hole between the two
+    when the last known listening isn't part of the retrieved history.
+    Return the number of new listenings.
+    """
+    last_known_played_at = database.select_last_played_at()
+    if last_known_played_at is None:
+        after = None
     else:
-        last_known_played_at = last_known_listening[0]
-
-    listenings = spotify.current_user_recently_played()
-    newest_played_at = None
+        # The `after` cursor is exclusive: start right before the last known
+        # listening so that it's retrieved again, proving there's no hole.
+        after = played_at_to_timestamp(last_known_played_at) - 1
+
+    listenings = sorted(
+        spotify.current_user_recently_played(after=after),
+        key=lambda listening: listening['played_at'],
+        reverse=True,
+    )
+    new_listenings = [
+        listening for listening in listenings
+        if last_known_played_at is None or
+        listening['played_at'] > last_known_played_at
+    ]
     oldest_played_at = None
-    nb_inserted = 0
-    for i, listening in enumerate(listenings):
-        listening_obj = listening_from_resource(listening)
-        if i == 0:
-            newest_played_at = listening_obj.played_at
-        if listening_obj.played_at == last_known_played_at:
-            logger.info(
-                "Match previous listenings fetch at %s", last_known_played_at
-            )
-            break
-        insert_song(database, listening['track'])
-        database.insert(listening_obj)
-        nb_inserted += 1
-        oldest_played_at = listening_obj.played_at
+    if new_listenings:
+        oldest_played_at = new_listenings[-1]['played_at']
+        newest_played_at = new_listenings[0]['played_at']
+    else:
+        newest_played_at = last_known_played_at
+
+    gap_from, gap_to = None, None
+    if any(
+        listening['played_at'] == last_known_played_at
+        for listening in listenings
+    ):
+        logger.info(
+            "Match previous listenings fetch at %s", last_known_played_at
+        )
     else:
         logger.info(
             "No match for previous listenings fetch. Hole between "
             "%s and %s", last_known_played_at, oldest_played_at,
         )
-
+        # Without any previous listening, nothing can have been missed
+        if last_known_played_at is not None:
+            gap_from, gap_to = last_known_played_at, oldest_played_at
+
+    insert_songs(database, [listening['track'] for listening in new_listenings])
+    listening_objs = [
+        listening_from_resource(listening) for listening in new_listenings
+    ]
+    database.bulk_insert(listening_objs)
+    database.update_listenings_aggregates(listening_objs)
+    database.insert_into('ListeningsRetrieval',
+        from_after=after,
+        to_after=(
+            None if newest_played_at is None
+            else played_at_to_timestamp(newest_played_at)
+        ),
+        date=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        nb_retrieved=len(new_listenings),
+        to_played_at=newest_played_at,
+        gap_from=gap_from,
+        gap_to=gap_to,
+    )
     database.commit()
     logger.info(
         "Added %s listenings. Newest played_at is now %s",
-        nb_inserted, newest_played_at
+        len(new_listenings), newest_played_at
     )
+    return len(new_listenings)
 
 
-def insert_song(database, track):
-    # Insert album
-    if not track['is_local']:
-        album_resource = track.get('album')
-        if album_resource is not None:
-            album_obj = album_from_resource(album_resource)
-            database.insert_or_leave(album_obj, 'spotify_id')
-
-    # Insert song
-    # The song object contains the album_id
-    song_obj = song_from_resource(track)
-    added_song = database.insert_or_leave(song_obj, 'spotify_id')
-
-    # Insert arists
-    if added_song and not track['is_local']:
-        for artist_resource in track['artists']:
-            artist_obj = artist_from_resource(artist_resource)
-            added_artist = database.insert_or_leave(artist_obj, 'spotify_id')
-            if added_artist:
-                database.insert_into(
-                    'SongByArtist',
-                    song_id=song_obj.spotify_id,
-                    artist_id=artist_obj.spotify_id,
-                )
+def pull_metadata(spotify, database):
+    """
+    Fetch the songs, albums and artists which are referenced but missing
+    from the database (e.g. after an import), or whose metadata is partial,
+    with the endpoints taking several IDs at once. Songs linked to no artist
+    (e.g. pulled before 1.4) are linked to theirs.
+    """
+    songs_ids = database.select_ids_to_hydrate('Song')
+    new_songs_ids = set(songs_ids) - database.select_existing(
+        'Song', 'spotify_id', songs_ids,
+    )
+    unlinked_songs_ids = set(database.select_ids_to_hydrate('SongByArtist'))
+    tracks = [track for track in spotify.tracks(songs_ids) if track is not None]
+    insert_songs(database, tracks)
+    database.bulk_insert_or_update(
+        (song_from_resource(track) for track in tracks), 'spotify_id',
+    )
+    repaired_links = [
+        (track['id'], artist['id']) for track in tracks
+        if track['id'] in unlinked_songs_ids
+        for artist in track['artists']
+    ]
+    database.bulk_insert_into(
+        'SongByArtist', ['song_id', 'artist_id'], repaired_links,
+    )
+    if new_songs_ids or repaired_links:
+        # The listenings of these songs now count for their artists
+        database.rebuild_listenings_aggregates()
+
+    albums_ids = database.select_ids_to_hydrate('Album')
+    albums = [album for album in spotify.albums(albums_ids) if album is not None]
+    database.bulk_insert_or_update(
+        (album_from_resource(album) for album in albums), 'spotify_id',
+    )
+
+    artists_ids = database.select_ids_to_hydrate('Artist')
+    artists = [
+        artist for artist in spotify.artists(artists_ids) if artist is not None
+    ]
+    database.bulk_insert_or_update(
+        (artist_from_resource(artist) for artist in artists), 'spotify_id',
+    )
+
+    database.commit()
+    logger.info(
+        "Fetched metadata of %s songs, %s albums and %s artists",
+        len(tracks), len(albums), len(artists),
+    )
+
+
+def insert_songs(database, tracks):
+    """
+    Insert the songs of the given track resources if they don't exist yet,
+    along with their albums and artists. Each table is written with a single
+    statement, and nothing is written for songs, albums and artists already
+    known by the database client.
+    """
+    tracks = list({track['id']: track for track in tracks}.values())
+    known_songs_ids = database.select_known(
+        'Song', [track['id'] for track in tracks],
+    )
+    new_tracks = [
+        track for track in tracks if track['id'] not in known_songs_ids
+    ]
+    if not new_tracks:
+        return
+    new_remote_tracks = [
+        track for track in new_tracks if not track['is_local']
+    ]
+
+    # Insert albums
+    albums = {
+        track['album']['id']: track['album'] for track in new_remote_tracks
+        if track.get('album') is not None
+    }
+    known_albums_ids = database.select_known('Album', albums.keys())
+    database.bulk_insert_or_leave(
+        (
+            album_from_resource(album) for album_id, album in albums.items()
+            if album_id not in known_albums_ids
+        ),
+        'spotify_id',
+    )
+    database.remember_known('Album', albums.keys())
+
+    # Insert songs
+    # The song objects contain the album_id
+    database.bulk_insert_or_leave(
+        (song_from_resource(track) for track in new_tracks),
+        'spotify_id',
+    )
+    database.remember_known('Song', (track['id'] for track in new_tracks))
+
+    # Insert artists
+    artists = {
+        artist['id']: artist for track in new_remote_tracks
+        for artist in track['artists']
+    }
+    known_artists_ids = database.select_known('Artist', artists.keys())
+    database.bulk_insert_or_leave(
+        (
+            artist_from_resource(artist)
+            for artist_id, artist in artists.items()
+            if artist_id not in known_artists_ids
+        ),
+        'spotify_id',
+    )
+    database.remember_known('Artist', artists.keys())
+    database.bulk_insert_into(
+        'SongByArtist',
+        ['song_id', 'artist_id'],
+        [
+            (track['id'], artist['id']) for track in new_remote_tracks
+            for artist in track['artists']
+        ],
+    )
 
 
 def song_from_resource(resource):
@@ -334,6 +783,7 @@ def playlist_from_resource(resource):
         name=resource['name'],
         owner_name=resource.get('owner', {}).get('display_name'),
         is_public=resource.get('public'),
+        snapshot_id=resource.get('snapshot_id'),
         **get_resource_basics(resource),
     )
 
@@ -373,6 +823,17 @@ def parse_id_from_context(context_resource):
         return None
 
 
+def played_at_to_timestamp(played_at):
+    """
+    Convert a played_at ISO datetime (UTC) to a timestamp in milliseconds,
+    as used by the cursors of the recently played API
+    """
+    date = datetime.datetime.fromisoformat(played_at.replace('Z', '+00:00'))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return round(date.timestamp() * 1000)
+
+
 def get_resource_basics(resource):
     return {
         'spotify_id': resource['id'],
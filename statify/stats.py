@@ -0,0 +1,142 @@
+"""
+Catalog of the reports of `statify stats`. Each report comes with the
+indexes it relies on, so that none of them needs a full scan of a table.
+"""
+import collections
+import csv
+import json
+
+
+Report = collections.namedtuple('Report', [
+    'name',
+    'description',
+    'columns',
+    'sql',      # with a single parameter: the maximum number of rows
+    'indexes',  # used by the query plan
+])
+
+
+REPORTS = [
+    Report(
+        name='songs',
+        description="Songs most listened to",
+        columns=['artists', 'song', 'play_count'],
+        sql="""
+            SELECT `Song`.`artists_names`, `Song`.`name`, `s`.`play_count`
+            FROM `ListeningsBySong` `s`
+            JOIN `Song` ON `Song`.`spotify_id` = `s`.`song_id`
+            ORDER BY `s`.`play_count` DESC
+            LIMIT ?
+        """,
+        indexes=['SongPlayCountIx'],
+    ),
+    Report(
+        name='artists',
+        description="Artists most listened to",
+        columns=['artist', 'play_count'],
+        sql="""
+            SELECT `Artist`.`name`, `a`.`play_count`
+            FROM `ListeningsByArtist` `a`
+            JOIN `Artist` ON `Artist`.`spotify_id` = `a`.`artist_id`
+            ORDER BY `a`.`play_count` DESC
+            LIMIT ?
+        """,
+        indexes=['ArtistPlayCountIx'],
+    ),
+    Report(
+        name='albums',
+        description="Albums most listened to (as albums)",
+        columns=['album', 'play_count'],
+        sql="""
+            SELECT max(`Album`.`name`), count(*) AS `play_count`
+            FROM `Listening`
+            JOIN `Album` ON `Album`.`spotify_id` = `Listening`.`album_id`
+            WHERE `Listening`.`context` = 'album'
+            GROUP BY `Listening`.`album_id`
+            ORDER BY `play_count` DESC
+            LIMIT ?
+        """,
+        indexes=['ListeningContextAlbumIx'],
+    ),
+    Report(
+        name='recent',
+        description="Latest listenings",
+        columns=['played_at', 'artists', 'song'],
+        sql="""
+            SELECT `Listening`.`played_at`, `Song`.`artists_names`,
+                `Song`.`name`
+            FROM `Listening`
+            JOIN `Song` ON `Song`.`spotify_id` = `Listening`.`song_id`
+            ORDER BY `Listening`.`played_at` DESC
+            LIMIT ?
+        """,
+        indexes=['ListeningPlayedAtIx'],
+    ),
+    Report(
+        name='days',
+        description="Days with the most listenings",
+        columns=['day', 'play_count'],
+        sql="""
+            SELECT `day`, `play_count` FROM `ListeningsByDay`
+            ORDER BY `play_count` DESC
+            LIMIT ?
+        """,
+        indexes=['DayPlayCountIx'],
+    ),
+    Report(
+        name='hours',
+        description="Number of listenings per hour of the day (UTC)",
+        columns=['hour', 'play_count'],
+        sql="""
+            SELECT `hour`, `play_count` FROM `ListeningsByHour`
+            ORDER BY `hour`
+            LIMIT ?
+        """,
+        indexes=['sqlite_autoindex_ListeningsByHour_1'],
+    ),
+    Report(
+        name='popular',
+        description="Most popular songs on Spotify among yours",
+        columns=['artists', 'song', 'popularity'],
+        sql="""
+            SELECT `artists_names`, `name`, `popularity` FROM `Song`
+            WHERE `popularity` IS NOT NULL
+            ORDER BY `popularity` DESC
+            LIMIT ?
+        """,
+        indexes=['SongPopularityIx'],
+    ),
+]
+
+
+CATALOG = {report.name: report for report in REPORTS}
+
+
+FORMATS = ['text', 'csv', 'json']
+
+
+def run_report(database, name, limit):
+    """
+    Return the rows of the report, as tuples
+    """
+    report = CATALOG[name]
+    return [tuple(row) for row in database.query(report.sql, limit)]
+
+
+def export_report(report, rows, file, format='text'):
+    if format == 'text':
+        for row in rows:
+            file.write('\t'.join(str(value) for value in row) + '\n')
+    elif format == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(report.columns)
+        writer.writerows(rows)
+    elif format == 'json':
+        json.dump(
+            [dict(zip(report.columns, row)) for row in rows],
+            file,
+            indent=2,
+        )
+        file.write('\n')
+    else:
+        raise ValueError("Unknown format: {}".format(format))
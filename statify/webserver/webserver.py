@@ -1,17 +1,42 @@
+import threading
 from datetime import datetime, timezone
 
 import flask
 
-from statify import database_client
-from statify.webserver import search
+from statify import config, database_client
 
 
 app = flask.Flask(__name__)
 
+AUTOCOMPLETE_LIMIT = 5
+
+
+_database_pool_lock = threading.Lock()
+
+
+def get_database_pool():
+    with _database_pool_lock:
+        pool = app.extensions.get('statify_database_pool')
+        if pool is None:
+            conf = config.load_config() or {}
+            pool = database_client.DatabasePool(
+                size=app.config.get('DATABASE_POOL_SIZE', 8),
+                pragmas=conf.get('database', {}).get(database_client.READER),
+            )
+            app.extensions['statify_database_pool'] = pool
+    return pool
+
 
 @app.before_request
-def ensure_db_client():
-    flask.g.db_client = database_client.StatifyDatabase()
+def acquire_db_client():
+    flask.g.db_client = get_database_pool().acquire()
+
+
+@app.teardown_request
+def release_db_client(exception):
+    db_client = flask.g.pop('db_client', None)
+    if db_client is not None:
+        get_database_pool().release(db_client)
 
 
 # Front
@@ -40,21 +65,16 @@ def autocomplete_endpoint():
     query = flask.request.args['query']
     words = [w.lower() for w in query.split()]
 
-    results = flask.g.db_client.search_songs(words)
-
-    results.sort(
-        key=lambda s: search.match_song_to_query(words=words, song=s),
-        reverse=True,
-    )
+    results = flask.g.db_client.search_songs(words, limit=AUTOCOMPLETE_LIMIT)
 
-    return flask.jsonify(results)
+    return flask.jsonify([song.asdict() for song in results])
 
 
 def listening_resource(listening):
     return {
-        **listening,
+        **listening.asdict(),
         'played_at': int(datetime.strptime(
-            listening['played_at'][:19],
+            listening.played_at[:19],
             '%Y-%m-%dT%H:%M:%S',
         ).replace(tzinfo=timezone.utc).timestamp())
     }
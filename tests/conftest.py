@@ -1,5 +1,7 @@
+import http.server
 import json
 import os
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
 
@@ -40,7 +42,9 @@ load_templates()
 def app():
     app = statify_webserver.app
     app.jinja_loader = jinja2.FunctionLoader(lambda name: TEMPLATES[name])
-    return app
+    yield app
+    # The pool holds clients of the database of the test
+    app.extensions.pop('statify_database_pool', None)
 
 
 @pytest.fixture
@@ -83,12 +87,15 @@ def cached_token(fs, statify_directory):
 @pytest.fixture
 def in_memory_database(mocker, statify_directory):
     database = database_client.StatifyDatabase(':memory:')
+    # Unlike a database file, the in-memory database would be lost if the
+    # code under test closed its client
+    mocker.patch.object(database, 'close')
     mocker.patch(
         'statify.statify.database_client.StatifyDatabase',
         return_value=database,
     )
     yield database
-    database.close()
+    database_client.StatifyDatabase.close(database)
 
 
 @pytest.fixture
@@ -97,3 +104,39 @@ def sql_spy(mocker):
     database_client.StatifyDatabase._sql = mocker.MagicMock()
     yield database_client.StatifyDatabase._sql
     database_client.StatifyDatabase._sql = backup
+
+
+@pytest.fixture
+def local_server():
+    """
+    HTTP server on localhost answering each request with the next status of
+    its `statuses` (the last one repeating) and a `Retry-After: 1` header.
+    Unlike `responses`, calls go through the real HTTP adapter.
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            server.nb_requests += 1
+            status = server.statuses[min(
+                server.nb_requests, len(server.statuses),
+            ) - 1]
+            body = b'{}'
+            self.send_response(status)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.statuses = [200]
+    server.nb_requests = 0
+    server.url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
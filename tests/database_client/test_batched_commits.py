@@ -0,0 +1,37 @@
+from statify import database_client
+
+
+def test_commit_every_rows(mocker):
+    database = mocker.Mock()
+    on_commit = mocker.Mock()
+    commits = database_client.BatchedCommits(
+        database, every_rows=3, every_seconds=60, on_commit=on_commit,
+    )
+
+    commits.add(2)
+    assert database.commit.call_count == 0
+    commits.add()
+    assert database.commit.call_count == 1
+    assert on_commit.call_count == 1
+    commits.add(2)
+    assert database.commit.call_count == 1
+
+
+def test_commit_every_seconds(mocker):
+    monotonic = mocker.patch('statify.database_client.time.monotonic')
+    monotonic.return_value = 100
+    database = mocker.Mock()
+    commits = database_client.BatchedCommits(
+        database, every_rows=1000, every_seconds=30,
+    )
+
+    monotonic.return_value = 120
+    commits.add()
+    assert database.commit.call_count == 0
+    monotonic.return_value = 130
+    commits.add()
+    assert database.commit.call_count == 1
+
+
+def test_writer_begins_immediate_transactions(in_memory_database):
+    assert in_memory_database._connection().isolation_level == 'IMMEDIATE'
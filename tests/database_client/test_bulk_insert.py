@@ -0,0 +1,69 @@
+from statify import database_client
+
+
+def artist(spotify_id, name):
+    return database_client.Artist(
+        spotify_id=spotify_id,
+        web_url=None,
+        api_url=None,
+        name=name,
+    )
+
+
+def test_bulk_insert_or_leave(in_memory_database, mocker):
+    in_memory_database.insert(artist('a1', 'Dusty Springfield'))
+    execute_many_spy = mocker.spy(in_memory_database, '_execute_many')
+
+    in_memory_database.bulk_insert_or_leave(
+        [
+            artist('a1', 'Renamed'),
+            artist('a2', 'Kool & The Gang'),
+            artist('a3', 'Bobby Womack'),
+        ],
+        'spotify_id',
+    )
+
+    assert execute_many_spy.call_count == 1
+    assert set(
+        tuple(r) for r in in_memory_database.select_from(
+            'Artist', ['spotify_id', 'name'],
+        )
+    ) == {
+        ('a1', 'Dusty Springfield'),
+        ('a2', 'Kool & The Gang'),
+        ('a3', 'Bobby Womack'),
+    }
+
+
+def test_bulk_insert_into(in_memory_database):
+    in_memory_database.bulk_insert_into(
+        'SongByArtist',
+        ['song_id', 'artist_id'],
+        [('s1', 'a1'), ('s1', 'a2')],
+    )
+
+    assert set(
+        tuple(r) for r in in_memory_database.select_from('SongByArtist', ['*'])
+    ) == {
+        ('s1', 'a1'),
+        ('s1', 'a2'),
+    }
+
+
+def test_bulk_insert_nothing(in_memory_database, mocker):
+    execute_many_spy = mocker.spy(in_memory_database, '_execute_many')
+
+    in_memory_database.bulk_insert([])
+    in_memory_database.bulk_insert_or_leave([], 'spotify_id')
+
+    assert execute_many_spy.call_count == 0
+
+
+def test_select_existing(in_memory_database, mocker):
+    mocker.patch.object(database_client, 'SQL_MAX_VARIABLES', 2)
+    for i in range(5):
+        in_memory_database.insert(artist('a{}'.format(i), 'Artist'))
+
+    assert in_memory_database.select_existing(
+        'Artist', 'spotify_id', ['a0', 'a2', 'a4', 'a7', 'a9'],
+    ) == {'a0', 'a2', 'a4'}
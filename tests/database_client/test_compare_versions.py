@@ -1,3 +1,5 @@
+import sqlite3
+
 import pytest
 
 from statify import (
@@ -19,7 +21,22 @@ def test_init_database_from_nothing(statify_directory, sql_spy, mocker):
     database_client.StatifyDatabase(':memory')
 
     assert sql_spy.mock_calls == [
-        mocker.call(stmt) for stmt in database_client.V1_0_STATEMENTS
+        mocker.call(stmt) for stmt in database_client.SQL_INIT_STATEMENTS
+    ]
+
+
+def test_init_database_from_previous_version(
+    statify_directory, sql_spy, mocker
+):
+    with open(str(database_client.DATABASE_VERSION_PATH), 'w') as version_file:
+        version_file.write('1.3.0')
+
+    mocker.patch.object(config, 'VERSION', '1.4.0')
+
+    database_client.StatifyDatabase(':memory')
+
+    assert sql_spy.mock_calls == [
+        mocker.call(stmt) for stmt in database_client.V1_4_STATEMENTS
     ]
 
 
@@ -42,3 +59,40 @@ def test_init_database_without_any_additional_sql(
     database_client.StatifyDatabase(':memory')
 
     assert sql_spy.mock_calls == []
+
+
+def test_parse_version():
+    parse_version = database_client._parse_version
+    assert parse_version('1.4') == parse_version('1.4.0')
+    assert parse_version('1.3.0') < parse_version('1.4.0')
+    assert parse_version('1.10.0') > parse_version('1.9.2')
+    assert parse_version('42424242.42.42') > parse_version('1.4.0')
+
+
+def test_failed_upgrade_is_rolled_back(tmp_path, mocker):
+    mocker.patch.object(
+        database_client, 'DATABASE_VERSION_PATH', tmp_path / 'database_version',
+    )
+    path = str(tmp_path / 'statify.sqlite')
+    mocker.patch.object(config, 'VERSION', '1.3.0')
+    database_client.StatifyDatabase(path).close()
+
+    mocker.patch.object(config, 'VERSION', '1.4.0')
+    get_updates = database_client._get_database_updates
+    failing_updates = mocker.patch.object(
+        database_client, '_get_database_updates',
+        side_effect=lambda version: (
+            get_updates(version)[:1] + ['SELECT * FROM `Missing`']
+        ),
+    )
+    with pytest.raises(sqlite3.OperationalError):
+        database_client.StatifyDatabase(path)
+    assert database_client._get_database_version() == '1.3.0'
+
+    failing_updates.side_effect = get_updates
+    database = database_client.StatifyDatabase(path)
+    assert database_client._get_database_version() == '1.4.0'
+    assert 'snapshot_id' in [
+        row['name'] for row in database.query('PRAGMA table_info(`Playlist`)')
+    ]
+    database.close()
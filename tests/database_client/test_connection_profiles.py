@@ -0,0 +1,41 @@
+import pytest
+
+from statify import config, database_client
+
+
+@pytest.fixture
+def database_path(tmp_path, mocker):
+    mocker.patch.object(
+        database_client, '_get_database_version', return_value=config.VERSION,
+    )
+    path = str(tmp_path / 'statify.sqlite')
+    # Creating the database file
+    database_client.StatifyDatabase(path)._connection()
+    return path
+
+
+def pragma(database, name):
+    return database.query('PRAGMA {}'.format(name)).fetchone()[0]
+
+
+def test_writer_profile(database_path):
+    database = database_client.StatifyDatabase(database_path)
+
+    assert pragma(database, 'journal_mode') == 'wal'
+    assert pragma(database, 'synchronous') == 1  # NORMAL
+    assert pragma(database, 'cache_size') == -64000
+    assert pragma(database, 'temp_store') == 2  # MEMORY
+    assert pragma(database, 'busy_timeout') == 5000
+
+
+def test_reader_profile_with_overrides(database_path):
+    database = database_client.StatifyDatabase(
+        database_path,
+        profile=database_client.READER,
+        pragmas={'cache_size': -1000},
+    )
+
+    assert pragma(database, 'journal_mode') == 'wal'
+    assert pragma(database, 'cache_size') == -1000
+    assert pragma(database, 'busy_timeout') == 5000
+    assert pragma(database, 'query_only') == 0  # read-only through the URI
@@ -0,0 +1,67 @@
+import sqlite3
+import threading
+
+import pytest
+
+from statify import config, database_client
+
+
+def test_pool_reuses_clients(statify_directory):
+    pool = database_client.DatabasePool(':memory:', size=2)
+
+    client1 = pool.acquire()
+    client2 = pool.acquire()
+    assert client1 is not client2
+
+    pool.release(client1)
+    assert pool.acquire() is client1
+
+
+def test_pool_blocks_when_exhausted(statify_directory):
+    pool = database_client.DatabasePool(':memory:', size=1)
+    client = pool.acquire()
+    acquired = []
+
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    thread.start()
+    thread.join(timeout=0.1)
+    assert acquired == []
+
+    pool.release(client)
+    thread.join()
+    assert acquired == [client]
+
+
+def test_pool_clients_are_readonly(tmp_path, mocker):
+    mocker.patch.object(
+        database_client, '_get_database_version', return_value=None,
+    )
+    set_version = mocker.patch.object(database_client, '_set_database_version')
+    path = str(tmp_path / 'statify.sqlite')
+
+    pool = database_client.DatabasePool(path)
+
+    assert set_version.mock_calls == [mocker.call(config.VERSION)]
+    assert tuple(
+        pool.acquire().query('PRAGMA journal_mode').fetchone()
+    ) == ('wal',)
+
+    client = pool.acquire()
+    # The connection is shared by the threads using the client
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(client.select_from('Song', ['*'])),
+    )
+    thread.start()
+    thread.join()
+    assert results == [[]]
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        client.insert_into('Artist', spotify_id='a1')
+
+
+def test_pool_closes_version_check_connection(statify_directory, mocker):
+    close = mocker.spy(database_client.StatifyDatabase, 'close')
+
+    database_client.DatabasePool(':memory:', size=2)
+
+    assert close.call_count == 1
@@ -0,0 +1,44 @@
+import pytest
+
+from statify.database_client import Artist, Listening, Song
+from .. import utils
+
+
+def test_entity_values():
+    artist = Artist('a1', 'web_url', api_url='api_url', name="Name")
+
+    assert not hasattr(artist, '__dict__')
+    assert artist.astuple() == ('a1', 'web_url', 'api_url', "Name")
+    assert artist.asdict() == {
+        'spotify_id': 'a1',
+        'web_url': 'web_url',
+        'api_url': 'api_url',
+        'name': "Name",
+    }
+    assert artist.replace(name="Other") == Artist(
+        'a1', 'web_url', 'api_url', "Other",
+    )
+    assert artist != artist.replace(name="Other")
+
+
+def test_entity_missing_values():
+    assert Listening('s1', 'played_at', None, None, None).listening_id is None
+    with pytest.raises(TypeError):
+        Artist('a1', 'web_url')
+    with pytest.raises(TypeError):
+        Artist('a1', 'web_url', 'api_url', "Name", genre="Pop")
+
+
+def test_entity_from_row(in_memory_database):
+    song = utils.song_factory(in_memory_database)
+    listening = utils.listening_factory(in_memory_database, song=song)
+
+    assert in_memory_database.select_song_by_spotify_id(song.spotify_id) == (
+        song
+    )
+    assert in_memory_database.select_listenings_by_spotify_id(
+        song.spotify_id
+    ) == [listening.replace(listening_id=1)]
+    assert isinstance(
+        in_memory_database.select_song_by_spotify_id(song.spotify_id), Song,
+    )
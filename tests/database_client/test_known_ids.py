@@ -0,0 +1,52 @@
+from statify import database_client, statify
+
+from .. import utils
+
+
+def test_known_ids_evicts_least_recently_used():
+    known_ids = database_client.KnownIds(2)
+    known_ids.update(['a', 'b'])
+    assert known_ids.touch('a')
+    known_ids.update(['c'])
+
+    assert 'a' in known_ids
+    assert 'b' not in known_ids
+    assert 'c' in known_ids
+    assert not known_ids.touch('b')
+
+
+def test_select_known(in_memory_database, mocker):
+    for spotify_id in ['s1', 's2', 's3']:
+        in_memory_database.insert_into('Song', spotify_id=spotify_id)
+    in_memory_database.known_ids_size = 2
+
+    select_existing = mocker.spy(in_memory_database, 'select_existing')
+
+    # The cache is warmed with the latest songs
+    assert in_memory_database.select_known('Song', ['s2', 's3']) == {
+        's2', 's3',
+    }
+    assert select_existing.call_args == mocker.call('Song', 'spotify_id', set())
+
+    assert in_memory_database.select_known('Song', ['s1', 's4']) == {'s1'}
+    assert select_existing.call_args == mocker.call(
+        'Song', 'spotify_id', {'s1', 's4'},
+    )
+
+    in_memory_database.remember_known('Song', ['s4'])
+    assert in_memory_database.select_known('Song', ['s4']) == {'s4'}
+    assert select_existing.call_args == mocker.call('Song', 'spotify_id', set())
+
+
+def test_rollback_forgets_known_ids(in_memory_database):
+    track = utils.spotify_track_factory()
+    statify.insert_songs(in_memory_database, [track])
+    in_memory_database.rollback()
+
+    statify.insert_songs(in_memory_database, [track])
+    in_memory_database.commit()
+
+    for table_name in ['Song', 'Album', 'Artist', 'SongByArtist']:
+        assert in_memory_database.query(
+            'SELECT count(*) FROM `{}`'.format(table_name)
+        ).fetchone()[0] == 1
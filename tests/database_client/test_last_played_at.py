@@ -0,0 +1,18 @@
+from statify import database_client
+
+
+def test_last_played_at_uses_index(in_memory_database):
+    plan = [
+        row['detail'] for row in in_memory_database.query(
+            'EXPLAIN QUERY PLAN {}'.format(
+                database_client.LAST_LISTENING_PLAYED_AT_STATEMENT
+            )
+        )
+    ]
+    assert plan == [
+        'SEARCH Listening USING COVERING INDEX ListeningPlayedAtIx',
+    ]
+
+
+def test_last_played_at_empty_database(in_memory_database):
+    assert in_memory_database.select_last_played_at() is None
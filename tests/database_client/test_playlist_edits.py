@@ -0,0 +1,71 @@
+from statify import database_client
+from statify.database_client import _plan_playlist_edits
+
+
+def test_plan_insert_between_tracks():
+    assert _plan_playlist_edits(
+        ['a', 'b', 'c'], [1024, 2048, 3072], ['a', 'x', 'y', 'b', 'c', 'z'],
+    ) == (
+        [],
+        [(1, 1365), (2, 1706), (5, 4096)],
+        [],
+    )
+
+
+def test_plan_delete_duplicate():
+    assert _plan_playlist_edits(
+        ['a', 'b', 'a'], [1024, 2048, 3072], ['a', 'b'],
+    ) == ([2], [], [])
+
+
+def test_plan_renumber_without_room():
+    assert _plan_playlist_edits(
+        ['a', 'b'], [1, 2], ['a', 'x', 'b'],
+    ) == (
+        [],
+        [(1, 2048)],
+        [(0, 1024), (1, 3072)],
+    )
+
+
+def test_plan_renumber_without_positions():
+    assert _plan_playlist_edits(
+        ['a', 'b'], [None, None], ['a', 'b'],
+    ) == (
+        [],
+        [],
+        [(0, 1024), (1, 2048)],
+    )
+
+
+def test_apply_staged_playlist_tracks_move(in_memory_database, mocker):
+    def sync(song_ids):
+        in_memory_database.clear_staged_playlist_tracks()
+        in_memory_database.stage_playlist_tracks(
+            (song_id, '2020-01-16T08:00:00Z') for song_id in song_ids
+        )
+        return in_memory_database.apply_staged_playlist_tracks('p1')
+
+    sync(['a', 'b', 'c', 'd'])
+    execute_many = mocker.spy(in_memory_database, '_execute_many')
+
+    assert sync(['b', 'c', 'a', 'd']) == (['a'], [('a', None)])
+
+    assert [
+        row['song_id'] for row in in_memory_database.query(
+            database_client.SELECT_PLAYLIST_TRACKS_STATEMENT, 'p1',
+        )
+    ] == ['b', 'c', 'a', 'd']
+    # Only the moved track is written: deleted, then inserted
+    assert [
+        len(call.args[1]) for call in execute_many.call_args_list
+        if 'SongInPlaylist' in call.args[0] and 'temp.' not in call.args[0]
+    ] == [1, 0, 1]
+    assert [
+        tuple(row) for row in in_memory_database.select_from(
+            'PlaylistEdit', ['operation', 'song_id', 'position'],
+        )
+    ][-2:] == [
+        ('delete', 'a', 0),
+        ('insert', 'a', 2),
+    ]
@@ -0,0 +1,132 @@
+from statify import database_client
+from .. import utils
+
+
+def test_search_songs_by_prefix(in_memory_database):
+    song = utils.song_factory(
+        in_memory_database,
+        name="Son of a Preacher Man",
+        artists_names="Dusty Springfield",
+    )
+    utils.song_factory(
+        in_memory_database,
+        name="Jungle Boogie",
+        artists_names="Kool & The Gang",
+    )
+
+    for words in [['preacher'], ['prea'], ['son', 'dusty'], ['p', 'man']]:
+        results = in_memory_database.search_songs(words)
+        assert [s.spotify_id for s in results] == [song.spotify_id]
+
+    assert in_memory_database.search_songs(['reacher']) == []
+    assert in_memory_database.search_songs(['preacher', 'gang']) == []
+    assert in_memory_database.search_songs(['&']) == []
+
+
+def test_search_songs_ranking(in_memory_database):
+    by_artist = utils.song_factory(
+        in_memory_database, name="Hello", artists_names="Love",
+    )
+    by_name = utils.song_factory(
+        in_memory_database, name="Love", artists_names="Hello",
+    )
+
+    results = in_memory_database.search_songs(['love'])
+
+    assert [s.spotify_id for s in results] == [
+        by_name.spotify_id, by_artist.spotify_id,
+    ]
+
+
+def test_search_index_follows_updates(in_memory_database):
+    song = utils.song_factory(in_memory_database, name="Old Name")
+
+    in_memory_database.insert_or_update(
+        song.replace(name="New Name"), 'spotify_id'
+    )
+
+    assert in_memory_database.search_songs(['old']) == []
+    assert [
+        s.name for s in in_memory_database.search_songs(['new'])
+    ] == ["New Name"]
+
+
+def test_search_songs_best_match_first(in_memory_database):
+    for name in ["Love Love Love", "Lovely Day", "All You Need Is Love"]:
+        utils.song_factory(in_memory_database, name=name)
+    exact_match = utils.song_factory(in_memory_database, name="Love")
+    for name in ["Crazy In Love", "Love Me Do", "Loverboy"]:
+        utils.song_factory(in_memory_database, name=name)
+
+    results = in_memory_database.search_songs(['love'], limit=1)
+
+    assert [s.spotify_id for s in results] == [exact_match.spotify_id]
+
+
+def test_search_songs_exact_match_beyond_candidates(in_memory_database):
+    exact_match = utils.song_factory(
+        in_memory_database, name="Love", artists_names="Someone",
+    )
+    for i in range(database_client.SEARCH_CANDIDATES + 50):
+        utils.song_factory(
+            in_memory_database,
+            name="Lovely Lovers" if i % 2 else "Lovebirds",
+            artists_names="Lovers",
+        )
+
+    results = in_memory_database.search_songs(['love'])
+
+    assert results[0].spotify_id == exact_match.spotify_id
+
+
+def test_search_songs_folds_non_ascii_case(in_memory_database):
+    # Preferred by bm25, but its name isn't exactly the word
+    utils.song_factory(
+        in_memory_database, name="Éternel Éternel", artists_names="Zaz",
+    )
+    best_match = utils.song_factory(
+        in_memory_database, name="Éternel", artists_names="Zaz",
+    )
+    for _ in range(10):
+        utils.song_factory(in_memory_database, name="Other", artists_names="Zaz")
+
+    results = in_memory_database.search_songs(['éternel'])
+
+    assert results[0].spotify_id == best_match.spotify_id
+
+
+def test_match_score(in_memory_database):
+    queries = [
+        "you need to calm down taylor swift",
+        "you need to calm down taylor",
+        "you need to calm down",
+        "calm taylor swift",
+        "you need",
+        "calm down",
+        "shakira",
+    ]
+
+    scores = []
+    for query in queries:
+        words = query.split(' ')
+        score = ' + '.join(
+            term
+            for _ in words
+            for field in ['name', 'artists_names']
+            for term in database_client._match_score_terms(
+                'casefold({})'.format(field)
+            )
+        )
+        params = [
+            param for w in words
+            for param in database_client._match_score_params(w)
+        ]
+        scores.append(in_memory_database.query(
+            'SELECT {} FROM (SELECT ? AS name, ? AS artists_names)'.format(
+                score
+            ),
+            *params, "You Need To Calm Down", "Taylor Swift",
+        ).fetchone()[0])
+
+    assert sorted(scores, reverse=True) == scores
+    assert len(set(scores)) == len(scores)
@@ -0,0 +1,28 @@
+import pypika
+
+from .. import utils
+
+
+def test_no_query_building_after_warm_up(in_memory_database, mocker):
+    song = utils.song_factory(in_memory_database)
+    in_memory_database.insert_or_update(song, 'spotify_id')
+    in_memory_database.insert_or_leave(song, 'spotify_id')
+    in_memory_database.select_from('Song', ['name'], spotify_id='s1')
+
+    for builder in ['Query', 'PostgreSQLQuery', 'Table']:
+        mocker.patch.object(
+            pypika, builder,
+            side_effect=AssertionError("Statement built twice"),
+        )
+
+    other_song = utils.song_factory(in_memory_database, name="Other Song")
+    in_memory_database.insert_or_update(
+        other_song.replace(name="Renamed Song"), 'spotify_id'
+    )
+    in_memory_database.insert_or_leave(song, 'spotify_id')
+
+    assert [
+        tuple(r) for r in in_memory_database.select_from(
+            'Song', ['name'], spotify_id=other_song.spotify_id,
+        )
+    ] == [("Renamed Song",)]
@@ -94,3 +94,141 @@ def test_paginate_bidirectional_spotipy_method(cached_token):
             {'limit': 1, 'before': 1, 'some_kwarg': 'yo'}
         ),
     ]
+
+
+def test_paginate_bidirectional_spotipy_method_after(cached_token):
+    client = spotify_client.Spotify(
+        'test_client_id',
+        'test_client_secret',
+        throttling=0,
+    )
+
+    cursors_logger = []
+
+    def fake_method(*args, **kwargs):
+        cursors_logger.append(kwargs['after'])
+        if kwargs['after'] == 100:
+            return {'items': ['item'], 'cursors': {'after': 200}}
+        return {'items': [], 'cursors': None}
+
+    results = list(client._paginate_bidirectional_spotipy_method(
+        fake_method,
+        page_size=1,
+        direction='after',
+        cursor=100,
+    ))
+
+    assert results == ['item']
+    assert cursors_logger == [100, 200]
+
+
+def test_paginate_bidirectional_spotipy_method_last_page(cached_token):
+    client = spotify_client.Spotify(
+        'test_client_id',
+        'test_client_secret',
+        throttling=0,
+    )
+
+    cursors_logger = []
+
+    def fake_method(*args, **kwargs):
+        cursors_logger.append(kwargs['after'])
+        if kwargs['after'] == 100:
+            # A full page, but the API says there's no next one
+            return {
+                'items': ['item', 'item'],
+                'cursors': {'after': 200, 'before': 150},
+                'next': None,
+            }
+        return {
+            'items': ['item'],
+            'cursors': {'after': 300, 'before': 250},
+            'next': 'https://api.spotify.com/v1/me/player/recently-played',
+        }
+
+    assert list(client._paginate_bidirectional_spotipy_method(
+        fake_method, page_size=2, direction='after', cursor=100,
+    )) == 2*['item']
+    assert cursors_logger == [100]
+
+    cursors_logger.clear()
+    # A partial page
+    assert list(client._paginate_bidirectional_spotipy_method(
+        fake_method, page_size=2, direction='after', cursor=200,
+    )) == ['item']
+    assert cursors_logger == [200]
+
+
+def test_paginate_spotipy_method_prefetch(cached_token):
+    client = spotify_client.Spotify(
+        'test_client_id',
+        'test_client_secret',
+        throttling=0,
+        concurrency=3,
+    )
+
+    offsets_logger = []
+
+    def fake_method(*args, **kwargs):
+        offsets_logger.append(kwargs['offset'])
+        return {
+            'items': [
+                'item{}'.format(i)
+                for i in range(kwargs['offset'], min(kwargs['offset'] + 2, 9))
+            ],
+            'total': 9,
+        }
+
+    results = list(client._paginate_spotipy_method(fake_method, page_size=2))
+
+    assert results == ['item{}'.format(i) for i in range(9)]
+    assert sorted(offsets_logger) == [0, 2, 4, 6, 8]
+
+
+def test_paginate_spotipy_method_next_url(cached_token, mocker):
+    client = spotify_client.Spotify(
+        'test_client_id',
+        'test_client_secret',
+        throttling=0,
+    )
+
+    first_page = {
+        'items': ['item1'],
+        'total': 3,
+        'next': 'https://api.spotify.com/v1/next-page',
+    }
+    second_page = {
+        'items': ['item2'],
+        'total': 3,
+        'next': None,  # total was outdated
+    }
+
+    fake_method = mocker.Mock(return_value=first_page)
+    mocker.patch.object(client.sp, 'next', return_value=second_page)
+
+    results = list(client._paginate_spotipy_method(fake_method, page_size=1))
+
+    assert results == ['item1', 'item2']
+    assert fake_method.call_count == 1
+    assert client.sp.next.mock_calls == [mocker.call(first_page)]
+
+
+def test_fetch_several_by_batches(cached_token):
+    client = spotify_client.Spotify(
+        'test_client_id',
+        'test_client_secret',
+        throttling=0,
+    )
+
+    batches = []
+
+    def fake_method(ids):
+        batches.append(ids)
+        return {'tracks': [{'id': id} if id != 'c' else None for id in ids]}
+
+    results = list(client._fetch_several(
+        fake_method, 'tracks', ['a', 'b', 'c', 'd', 'e'], 2,
+    ))
+
+    assert results == [{'id': 'a'}, {'id': 'b'}, None, {'id': 'd'}, {'id': 'e'}]
+    assert batches == [['a', 'b'], ['c', 'd'], ['e']]
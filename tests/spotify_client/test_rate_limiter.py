@@ -0,0 +1,30 @@
+from statify import spotify_client
+
+
+def test_rate_limiter_waits_for_tokens(mocker):
+    clock = mocker.patch('statify.spotify_client.time.monotonic')
+    sleep = mocker.patch('statify.spotify_client.time.sleep')
+    clock.return_value = 100
+
+    limiter = spotify_client.RateLimiter(rate=2)
+
+    limiter.acquire()  # initial token
+    limiter.acquire()  # must wait for the next one
+    limiter.acquire()  # queued behind the previous one
+
+    assert sleep.mock_calls == [mocker.call(0.5), mocker.call(1)]
+
+    clock.return_value = 110
+    limiter.acquire()  # bucket refilled (capped to the burst)
+
+    assert len(sleep.mock_calls) == 2
+
+
+def test_rate_limiter_disabled(mocker):
+    sleep = mocker.patch('statify.spotify_client.time.sleep')
+
+    limiter = spotify_client.RateLimiter(rate=None)
+    for _ in range(10):
+        limiter.acquire()
+
+    assert sleep.mock_calls == []
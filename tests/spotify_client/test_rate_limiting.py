@@ -0,0 +1,114 @@
+import pytest
+import spotipy
+
+from statify import spotify_client
+
+
+@pytest.fixture
+def clock(mocker):
+    clock = mocker.patch('statify.spotify_client.time.monotonic')
+    clock.return_value = 100
+    return clock
+
+
+def test_call_honors_retry_after(cached_token, clock, mocker):
+    sleep = mocker.patch('statify.spotify_client.time.sleep')
+    client = spotify_client.Spotify(
+        'test_client_id',
+        'test_client_secret',
+        throttling=0,
+    )
+
+    responses = [
+        spotipy.SpotifyException(429, -1, 'Too many', headers={
+            'Retry-After': '7',
+        }),
+        {'items': []},
+    ]
+
+    def fake_method(*args, **kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert client._call(fake_method) == {'items': []}
+    assert sleep.mock_calls == [mocker.call(7)]
+    assert client.metrics() == {
+        'rate': None,
+        'nb_calls': 2,
+        'nb_rate_limited': 1,
+        'nb_retries': 1,
+    }
+
+
+def test_call_gives_up_after_max_retries(cached_token, clock, mocker):
+    mocker.patch('statify.spotify_client.time.sleep')
+    client = spotify_client.Spotify(
+        'test_client_id',
+        'test_client_secret',
+        throttling=0,
+        max_retries=2,
+    )
+
+    def fake_method(*args, **kwargs):
+        raise spotipy.SpotifyException(429, -1, 'Too many')
+
+    with pytest.raises(spotipy.SpotifyException):
+        client._call(fake_method)
+
+    assert client.metrics()['nb_rate_limited'] == 3
+    assert client.metrics()['nb_retries'] == 2
+
+
+def test_adaptive_rate(clock, mocker):
+    mocker.patch('statify.spotify_client.time.sleep')
+    limiter = spotify_client.AdaptiveRateLimiter(
+        rate=2, max_rate=3, rate_increase=0.5,
+    )
+
+    limiter.succeeded()
+    assert limiter.rate == 2.5
+    limiter.succeeded()
+    limiter.succeeded()
+    assert limiter.rate == 3
+
+    limiter.rate_limited(retry_after=1)
+    assert limiter.rate == 1.5
+    for _ in range(10):
+        limiter.rate_limited(retry_after=1)
+    assert limiter.rate == limiter.min_rate == 0.25
+
+
+def test_parse_retry_after():
+    assert spotify_client.parse_retry_after('12') == 12
+    assert spotify_client.parse_retry_after(None) == 1
+    assert spotify_client.parse_retry_after('Wed, 21 Oct 2015 07:28:00') == 1
+
+
+def test_rate_limited_http_calls_reach_the_limiter(
+    cached_token, local_server, clock, mocker
+):
+    sleep = mocker.patch('statify.spotify_client.time.sleep')
+    client = spotify_client.Spotify(
+        'test_client_id',
+        'test_client_secret',
+        throttling=0.5,
+        max_retries=2,
+    )
+    client.sp.prefix = local_server.url
+    local_server.statuses = [429]
+
+    with pytest.raises(spotipy.SpotifyException):
+        client._call(client.sp.current_user_playlists)
+
+    # Each attempt is a single request, whose Retry-After is honored by the
+    # rate limiter, and halves the rate
+    assert local_server.nb_requests == 3
+    assert client.metrics() == {
+        'rate': 0.25,
+        'nb_calls': 3,
+        'nb_rate_limited': 3,
+        'nb_retries': 2,
+    }
+    assert mocker.call(1) in sleep.mock_calls
@@ -0,0 +1,42 @@
+from statify import spotify_client
+
+
+def test_session_shared_by_all_calls(cached_token):
+    client = spotify_client.Spotify('test_client_id', 'test_client_secret')
+
+    assert client.sp._session is client.session
+    assert client.oauth_manager._session is client.session
+
+
+def test_session_pool_sized_to_concurrency(cached_token):
+    client = spotify_client.Spotify(
+        'test_client_id', 'test_client_secret', concurrency=4,
+    )
+
+    adapter = client.session.get_adapter('https://api.spotify.com/v1/me')
+    assert adapter._pool_maxsize == 20
+
+
+def test_session_leaves_rate_limiting_to_the_client(local_server):
+    session = spotify_client.build_session(1, retries=3, backoff_factor=0)
+
+    local_server.statuses = [429]
+    assert session.get(local_server.url).status_code == 429
+    assert local_server.nb_requests == 1
+
+
+def test_session_retries_server_errors(local_server):
+    session = spotify_client.build_session(1, retries=3, backoff_factor=0)
+
+    local_server.statuses = [503, 503, 200]
+    assert session.get(local_server.url).status_code == 200
+    assert local_server.nb_requests == 3
+
+
+def test_session_pool_size_from_config(cached_token):
+    client = spotify_client.Spotify(
+        'test_client_id', 'test_client_secret', pool_size=3,
+    )
+
+    adapter = client.session.get_adapter('https://api.spotify.com/v1/me')
+    assert adapter._pool_maxsize == 3
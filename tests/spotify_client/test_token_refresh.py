@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+
+import responses
+
+from statify import spotify_client
+from .. import utils
+
+
+def write_cached_token(expires_in):
+    with open(str(spotify_client.OAUTH_TOKENS_PATH), 'w') as token_file:
+        json.dump(
+            {
+                'token_type': 'Bearer',
+                'expires_in': 3600,
+                'expires_at': int(time.time()) + expires_in,
+                'scope': 'playlist-read-private user-read-recently-played',
+                'refresh_token': 'refresh_token',
+                'access_token': 'old_access_token',
+            },
+            token_file,
+        )
+
+
+def add_token_response():
+    responses.add(
+        'POST',
+        'https://accounts.spotify.com/api/token',
+        json={
+            'token_type': 'Bearer',
+            'expires_in': 3600,
+            'scope': 'playlist-read-private user-read-recently-played',
+            'access_token': 'new_access_token',
+        },
+    )
+
+
+def add_tracks_response(status=200):
+    responses.add(
+        'GET',
+        'https://api.spotify.com/v1/tracks/',
+        json={'tracks': [utils.spotify_track_factory()]},
+        status=status,
+    )
+
+
+def authorization_headers():
+    return [
+        call.request.headers.get('Authorization') for call in responses.calls
+        if call.request.url.startswith('https://api.spotify.com')
+    ]
+
+
+@responses.activate
+def test_refresh_before_expiration(statify_directory):
+    write_cached_token(expires_in=60)
+    add_token_response()
+    add_tracks_response()
+    client = spotify_client.Spotify(
+        'test_client_id', 'test_client_secret', throttling=0,
+    )
+
+    assert len(list(client.tracks(['test_track_id']))) == 1
+
+    assert authorization_headers() == ['Bearer new_access_token']
+    with open(str(spotify_client.OAUTH_TOKENS_PATH)) as token_file:
+        token_info = json.load(token_file)
+    assert token_info['access_token'] == 'new_access_token'
+    assert token_info['refresh_token'] == 'refresh_token'
+
+
+@responses.activate
+def test_no_refresh_of_valid_token(statify_directory):
+    write_cached_token(expires_in=3600)
+    add_tracks_response()
+    client = spotify_client.Spotify(
+        'test_client_id', 'test_client_secret', throttling=0,
+    )
+
+    list(client.tracks(['test_track_id']))
+    list(client.tracks(['test_track_id']))
+
+    assert authorization_headers() == 2 * ['Bearer old_access_token']
+
+
+@responses.activate
+def test_refresh_on_rejected_token(statify_directory):
+    write_cached_token(expires_in=3600)
+    add_token_response()
+    add_tracks_response(status=401)
+    add_tracks_response()
+    client = spotify_client.Spotify(
+        'test_client_id', 'test_client_secret', throttling=0,
+    )
+
+    assert len(list(client.tracks(['test_track_id']))) == 1
+
+    assert authorization_headers() == [
+        'Bearer old_access_token', 'Bearer new_access_token',
+    ]
+
+
+def test_single_refresh_for_concurrent_rejections(mocker):
+    oauth_manager = mocker.Mock()
+    oauth_manager.refresh_access_token.return_value = {
+        'access_token': 'new_access_token',
+        'refresh_token': 'refresh_token',
+        'expires_at': int(time.time()) + 3600,
+    }
+    token_manager = spotify_client.TokenManager(oauth_manager, {
+        'access_token': 'old_access_token',
+        'refresh_token': 'refresh_token',
+        'expires_at': int(time.time()) + 3600,
+    })
+
+    threads = [
+        threading.Thread(
+            target=token_manager.refresh, args=('old_access_token',),
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert oauth_manager.refresh_access_token.mock_calls == [
+        mocker.call('refresh_token'),
+    ]
+    assert token_manager.get_access_token() == 'new_access_token'
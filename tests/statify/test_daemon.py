@@ -0,0 +1,71 @@
+import argparse
+
+from statify import spotify_client, statify
+
+
+def test_next_listenings_interval():
+    assert statify.next_listenings_interval(600, 0, 300, 3600) == 1200
+    assert statify.next_listenings_interval(2400, 0, 300, 3600) == 3600
+    assert statify.next_listenings_interval(600, 10, 300, 3600) == 1200
+    assert statify.next_listenings_interval(600, 40, 300, 3600) == 300
+
+
+def test_run_daemon(mocker):
+    clock = [0]
+    listenings_pulls = []
+    playlists_pulls = []
+
+    def sleep(delay):
+        clock[0] += delay
+
+    def fake_pull_listenings(spotify, database):
+        listenings_pulls.append(clock[0])
+        result = [20, 0, RuntimeError, 40, KeyboardInterrupt][
+            len(listenings_pulls) - 1
+        ]
+        if isinstance(result, type):
+            raise result
+        return result
+
+    def fake_pull_playlists(spotify, database, commit_every_rows):
+        playlists_pulls.append(clock[0])
+
+    mocker.patch.object(statify, 'pull_listenings', fake_pull_listenings)
+    mocker.patch.object(statify, 'pull_playlists', fake_pull_playlists)
+    logging_mock = mocker.patch('statify.statify.logger')
+    database = mocker.Mock()
+
+    try:
+        statify.run_daemon(
+            mocker.Mock(), database, {'commit_every_rows': 10},
+            min_interval=300, max_interval=3600, playlists_interval=1000,
+            timefunc=lambda: clock[0], delayfunc=sleep,
+        )
+    except KeyboardInterrupt:
+        pass
+
+    # 20 listenings: same interval, none: twice as long, failure: same
+    # interval, 40 listenings: half as long
+    assert listenings_pulls == [0, 300, 900, 1500, 1800]
+    assert playlists_pulls == [0, 1000]
+    assert logging_mock.exception.call_count == 1
+    assert database.rollback.call_count == 1
+
+
+def test_daemon_command(statify_config, cached_token, in_memory_database, mocker):
+    run_daemon_mock = mocker.patch.object(
+        statify, 'run_daemon', side_effect=KeyboardInterrupt,
+    )
+    close = mocker.spy(spotify_client.Spotify, 'close')
+    logging_mock = mocker.patch('statify.statify.logger')
+
+    statify._main(argparse.Namespace(command='daemon'))
+
+    assert run_daemon_mock.call_args == mocker.call(
+        mocker.ANY, in_memory_database, {},
+    )
+    assert logging_mock.info.call_args_list == [
+        mocker.call("Starting daemon"),
+        mocker.call("Daemon stopped"),
+    ]
+    assert close.call_count == 1
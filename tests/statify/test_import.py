@@ -0,0 +1,162 @@
+import argparse
+import io
+import json
+import os
+
+import pytest
+
+from statify import data_import, statify
+from .. import utils
+
+
+def test_iter_json_array_by_chunks():
+    values = [{'a': 'x' * i, 'b': [i, None]} for i in range(20)] + [42, 'y']
+    text = ' \n' + json.dumps(values, indent=2) + '\n'
+
+    for chunk_size in [1, 7, 100, 10000]:
+        assert list(data_import.iter_json_array(
+            io.StringIO(text), chunk_size=chunk_size,
+        )) == values
+
+    assert list(data_import.iter_json_array(io.StringIO('[]'))) == []
+    with pytest.raises(ValueError):
+        list(data_import.iter_json_array(io.StringIO('{"a": 1}')))
+    with pytest.raises(ValueError):
+        list(data_import.iter_json_array(io.StringIO('[{"a": 1}, {"b"')))
+
+
+def write_export(directory, name, entries):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'w') as export_file:
+        json.dump(entries, export_file)
+
+
+def test_import(statify_config, in_memory_database, mocker):
+    song = utils.song_factory(
+        in_memory_database, name="Diamond Veins", artists_names="French 79",
+    )
+    # Already pulled from the API, a few seconds apart from the export
+    utils.listening_factory(
+        in_memory_database, song=song, played_at='2020-05-04T17:17:18.254Z',
+    )
+    write_export('/export', 'StreamingHistory0.json', [
+        {
+            'endTime': '2020-05-04 17:17',
+            'artistName': "French 79",
+            'trackName': "Diamond Veins",
+            'msPlayed': 240120,
+        },
+        {
+            'endTime': '2020-05-05 09:00',
+            'artistName': "French 79",
+            'trackName': "Diamond Veins",
+            'msPlayed': 240120,
+        },
+        {
+            'endTime': '2020-05-05 09:01',
+            'artistName': "French 79",
+            'trackName': "Diamond Veins",
+            'msPlayed': 3822,
+        },
+        {
+            'endTime': '2020-05-05 09:05',
+            'artistName': "Unknown",
+            'trackName': "Unknown",
+            'msPlayed': 240120,
+        },
+    ])
+    write_export('/export', 'endsong_0.json', [
+        {
+            'ts': '2020-05-05T09:00:41Z',
+            'ms_played': 240120,
+            'master_metadata_track_name': "Diamond Veins",
+            'master_metadata_album_artist_name': "French 79",
+            'spotify_track_uri': 'spotify:track:{}'.format(song.spotify_id),
+        },
+        {
+            'ts': '2020-05-06T10:00:00Z',
+            'ms_played': 180000,
+            'master_metadata_track_name': "Other",
+            'master_metadata_album_artist_name': "Other",
+            'spotify_track_uri': 'spotify:track:other',
+        },
+    ])
+    logging_mock = mocker.patch('statify.statify.logger')
+
+    statify._main(argparse.Namespace(command='import', directory='/export'))
+
+    assert logging_mock.info.call_args_list == [
+        mocker.call(
+            'Imported %s listenings out of %s (%s already known, %s too '
+            'short, %s of unknown songs)',
+            2, 6, 2, 1, 1,
+        ),
+    ]
+    assert [
+        tuple(row) for row in in_memory_database.query(
+            'SELECT `song_id`, `played_at` FROM `Listening` '
+            'ORDER BY `played_at`'
+        )
+    ] == [
+        (song.spotify_id, '2020-05-04T17:17:18.254Z'),
+        (song.spotify_id, '2020-05-05T09:00:00Z'),
+        ('other', '2020-05-06T10:00:00Z'),
+    ]
+    assert [
+        tuple(row) for row in in_memory_database.select_from(
+            'ListeningsBySong', ['song_id', 'play_count'], order_by='song_id',
+        )
+    ] == sorted([(song.spotify_id, 2), ('other', 1)])
+
+
+def test_reimport_is_idempotent(statify_config, in_memory_database):
+    song = utils.song_factory(in_memory_database)
+    write_export('/export', 'endsong_0.json', [
+        {
+            'ts': '2020-05-05T09:00:{:02}Z'.format(second),
+            'ms_played': 240120,
+            'spotify_track_uri': 'spotify:track:{}'.format(song.spotify_id),
+        }
+        for second in [0, 59]
+    ] + [
+        {
+            'ts': '2020-05-05T09:10:59Z',
+            'ms_played': 240120,
+            'spotify_track_uri': 'spotify:track:{}'.format(song.spotify_id),
+        },
+    ])
+
+    counts = data_import.import_listenings(in_memory_database, '/export')
+    assert counts['imported'] == 2
+    assert counts['known'] == 1
+
+    counts = data_import.import_listenings(in_memory_database, '/export')
+    assert counts['imported'] == 0
+    assert counts['known'] == 3
+
+
+def test_import_across_minute_boundary(statify_config, in_memory_database):
+    song = utils.song_factory(in_memory_database)
+    other_song = utils.song_factory(in_memory_database)
+    utils.listening_factory(
+        in_memory_database, song=song, played_at='2020-05-04T17:17:58.254Z',
+    )
+    write_export('/export', 'endsong_0.json', [
+        {
+            'ts': '2020-05-04T17:18:02Z',
+            'ms_played': 240120,
+            'spotify_track_uri': 'spotify:track:{}'.format(spotify_id),
+        }
+        for spotify_id in [song.spotify_id, other_song.spotify_id]
+    ])
+
+    counts = data_import.import_listenings(in_memory_database, '/export')
+
+    assert counts['imported'] == 1
+    assert counts['known'] == 1
+    assert [
+        tuple(row) for row in in_memory_database.query(
+            'SELECT `song_id`, `played_at` FROM `Listening` '
+            'WHERE `song_id` = ?', other_song.spotify_id,
+        )
+    ] == [(other_song.spotify_id, '2020-05-04T17:18:02Z')]
@@ -243,3 +243,125 @@ def test_pull_listenings_no_new_listening(
     assert tuple(latest) == (
         1, 't2', '2020-07-07T16:53:23', 'playlist', None, 'test_playlist_id'
     )
+
+
+@responses.activate
+def test_pull_listenings_records_high_water_mark(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    """
+    The next pull reads the newest played_at from the last retrieval.
+    """
+    in_memory_database.insert_into('Listening',
+        song_id='t1',
+        played_at="2020-07-07T16:48:45",
+        context='playlist',
+        album_id=None,
+        playlist_id='test_playlist_id',
+    )
+    assert in_memory_database.select_last_played_at() == "2020-07-07T16:48:45"
+
+    utils.add_current_user_recently_played_response([
+        utils.spotify_listening_factory(
+            played_at="2020-07-07T16:53:23",
+            track=utils.spotify_track_factory(id='t2'),
+        ),
+        utils.spotify_listening_factory(
+            played_at="2020-07-07T16:48:45",
+            track=utils.spotify_track_factory(id='t1'),
+        ),
+    ])
+
+    statify._main(argparse.Namespace(command='pull', what='listenings'))
+
+    assert [
+        tuple(row) for row in in_memory_database.select_from(
+            'ListeningsRetrieval',
+            ['from_after', 'to_after', 'nb_retrieved', 'to_played_at',
+             'gap_from'],
+        )
+    ] == [(1594140525000 - 1, 1594140803000, 1, "2020-07-07T16:53:23", None)]
+    assert 'after=1594140524999' in responses.calls[-1].request.url
+
+    # The mark is used without looking at the listenings
+    in_memory_database.delete_from('Listening')
+    assert in_memory_database.select_last_played_at() == "2020-07-07T16:53:23"
+
+
+@responses.activate
+def test_pull_listenings_records_gap(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    """
+    The last known listening isn't retrieved again: the hole is recorded. The
+    first pull has no previous listening, so no hole.
+    """
+    gaps_query = (
+        'SELECT `gap_from`, `gap_to`, `to_played_at` '
+        'FROM `ListeningsRetrieval` '
+        'WHERE `gap_from` IS NOT NULL OR `gap_to` IS NOT NULL'
+    )
+    utils.add_current_user_recently_played_response([
+        utils.spotify_listening_factory(
+            played_at="2020-07-06T10:00:00.000Z",
+            track=utils.spotify_track_factory(id='t0'),
+        ),
+    ])
+
+    statify._main(argparse.Namespace(command='pull', what='listenings'))
+
+    assert in_memory_database.query(gaps_query).fetchall() == []
+
+    utils.add_current_user_recently_played_response([
+        utils.spotify_listening_factory(
+            played_at="2020-07-07T16:48:45.000Z",
+            track=utils.spotify_track_factory(id='t1'),
+        ),
+        utils.spotify_listening_factory(
+            played_at="2020-07-07T16:53:23.000Z",
+            track=utils.spotify_track_factory(id='t2'),
+        ),
+    ])
+
+    statify._main(argparse.Namespace(command='pull', what='listenings'))
+
+    assert [
+        tuple(row) for row in in_memory_database.query(gaps_query)
+    ] == [
+        (
+            "2020-07-06T10:00:00.000Z",
+            "2020-07-07T16:48:45.000Z",
+            "2020-07-07T16:53:23.000Z",
+        ),
+    ]
+    assert in_memory_database.select_last_played_at() == (
+        "2020-07-07T16:53:23.000Z"
+    )
+
+
+@responses.activate
+def test_pull_listenings_known_song(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    """
+    A song played again doesn't write anything but the listening.
+    """
+    for played_at in ["2020-07-07T16:48:45.000Z", "2020-07-07T16:53:23.000Z"]:
+        utils.add_current_user_recently_played_response([
+            utils.spotify_listening_factory(
+                played_at=played_at,
+                track=utils.spotify_track_factory(id='t1'),
+            ),
+        ])
+
+    statify._main(argparse.Namespace(command='pull', what='listenings'))
+
+    execute_many = mocker.spy(in_memory_database, '_execute_many')
+    statify._main(argparse.Namespace(command='pull', what='listenings'))
+
+    inserted_tables = [
+        call.args[0].split()[2] for call in execute_many.call_args_list
+        if call.args[0].startswith('INSERT INTO "')
+    ]
+    assert inserted_tables == ['"Listening"']
+    assert len(in_memory_database.select_from('Listening', ['*'])) == 2
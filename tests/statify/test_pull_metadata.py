@@ -0,0 +1,123 @@
+import argparse
+
+import responses
+
+from statify import statify
+from statify.database_client import Artist
+from .. import utils
+
+
+@responses.activate
+def test_pull_metadata(statify_config, cached_token, in_memory_database, mocker):
+    # Imported listening of a song that was never pulled
+    utils.listening_factory(
+        in_memory_database,
+        song=mocker.Mock(spotify_id='test_track_id'),
+        played_at='2020-05-04T17:17:00Z',
+    )
+    # Song whose metadata is partial
+    partial_song = utils.song_factory(in_memory_database, popularity=None)
+    # Artist whose name is missing
+    in_memory_database.insert(Artist(
+        spotify_id='nameless_artist_id',
+        web_url='https://open.spotify.com/artist/nameless_artist_id',
+        api_url='https://api.spotify.com/v1/artists/nameless_artist_id',
+        name=None,
+    ))
+    in_memory_database.commit()
+
+    responses.add(
+        'GET',
+        'https://api.spotify.com/v1/tracks/',
+        json={'tracks': [
+            utils.spotify_track_factory(),
+            utils.spotify_track_factory(
+                id=partial_song.spotify_id,
+                name=partial_song.name,
+                popularity=42,
+                album=utils.spotify_album_factory(id=partial_song.album_id),
+            ),
+        ]},
+    )
+    responses.add(
+        'GET',
+        'https://api.spotify.com/v1/albums/',
+        json={'albums': [
+            utils.spotify_album_factory(id=partial_song.album_id),
+        ]},
+    )
+    responses.add(
+        'GET',
+        'https://api.spotify.com/v1/artists/',
+        json={'artists': [
+            utils.spotify_artist_factory(
+                id='nameless_artist_id', name="Named Artist",
+            ),
+        ]},
+    )
+    logging_mock = mocker.patch('statify.statify.logger')
+
+    statify._main(argparse.Namespace(command='pull', what='metadata'))
+
+    assert logging_mock.info.call_args_list == [
+        mocker.call(
+            'Fetched metadata of %s songs, %s albums and %s artists', 2, 1, 1,
+        ),
+    ]
+    assert [
+        tuple(row) for row in in_memory_database.select_from(
+            'Song', ['spotify_id', 'popularity'], order_by='spotify_id',
+        )
+    ] == sorted([('test_track_id', 74), (partial_song.spotify_id, 42)])
+    assert in_memory_database.select_ids_to_hydrate('Song') == []
+    assert in_memory_database.select_ids_to_hydrate('Album') == []
+    assert in_memory_database.select_ids_to_hydrate('Artist') == []
+    assert [
+        tuple(row) for row in in_memory_database.select_from(
+            'ListeningsByArtist', ['artist_id', 'play_count'],
+        )
+    ] == [('test_artist_id', 1)]
+
+
+@responses.activate
+def test_pull_metadata_links_songs_to_artists(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    # Pulled before 1.4, by an artist already known then: never linked
+    in_memory_database.insert(Artist(
+        spotify_id='test_artist_id',
+        web_url='https://open.spotify.com/artist/test_artist_id',
+        api_url='https://api.spotify.com/v1/artists/test_artist_id',
+        name="Test Artist Name",
+    ))
+    in_memory_database.insert_into(
+        'Album', spotify_id='test_album_id', release_date='1999-03-10',
+    )
+    song = utils.song_factory(
+        in_memory_database, spotify_id='test_track_id', album_id='test_album_id',
+    )
+    utils.listening_factory(in_memory_database, song=song)
+    in_memory_database.rebuild_listenings_aggregates()
+    in_memory_database.commit()
+    assert in_memory_database.select_ids_to_hydrate('Song') == ['test_track_id']
+
+    responses.add(
+        'GET',
+        'https://api.spotify.com/v1/tracks/',
+        json={'tracks': [utils.spotify_track_factory()]},
+    )
+    mocker.patch('statify.statify.logger')
+
+    statify._main(argparse.Namespace(command='pull', what='metadata'))
+
+    assert [
+        tuple(row) for row in in_memory_database.select_from(
+            'SongByArtist', ['song_id', 'artist_id'],
+        )
+    ] == [('test_track_id', 'test_artist_id')]
+    assert [
+        tuple(row) for row in in_memory_database.select_from(
+            'ListeningsByArtist', ['artist_id', 'play_count'],
+        )
+    ] == [('test_artist_id', 1)]
+    assert in_memory_database.select_ids_to_hydrate('Song') == []
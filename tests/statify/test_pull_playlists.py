@@ -1,5 +1,7 @@
 import argparse
 
+import pytest
+import requests
 import responses
 
 from statify import statify
@@ -87,7 +89,8 @@ def test_pull_playlist_add_playlist(
         'https://mosaic.scdn.co/640/test_url_token640',
         'Tarantino',
         '0',
-        'Valentin'
+        'Valentin',
+        'test_snapshot_id',
     )]
 
     assert set(
@@ -132,8 +135,8 @@ def test_pull_playlist_add_playlist(
     assert set(
         tuple(r) for r in in_memory_database.select_from('SongInPlaylist', ['*'])
     ) == {
-        ('t1', 'test_playlist_id', '2020-01-16T08:00:00Z'),
-        (local_song_id, 'test_playlist_id', '2020-01-16T08:05:00Z')
+        ('t1', 'test_playlist_id', '2020-01-16T08:00:00Z', 1024),
+        (local_song_id, 'test_playlist_id', '2020-01-16T08:05:00Z', 2048)
     }
 
 
@@ -179,6 +182,58 @@ def test_pull_playlist_update_playlist(
     ]
 
 
+@responses.activate
+def test_pull_playlist_unchanged_snapshot(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    """
+    1 playlist whose snapshot didn't change. Its tracks are not fetched.
+    """
+    in_memory_database.insert_into('Playlist',
+        spotify_id='test_playlist_id',
+        api_url='https://api.spotify.com/v1/playlists/test_playlist_id',
+        web_url='https://open.spotify.com/playlist/test_playlist_id',
+        cover_url='https://mosaic.scdn.co/640/test_url_token640',
+        name='Tarantino',
+        is_public=False,
+        owner_name='Valentin',
+        snapshot_id='test_snapshot_id',
+    )
+    in_memory_database.insert_into('SongInPlaylist',
+        song_id='t1',
+        playlist_id='test_playlist_id',
+        added_at='2020-01-16T08:00:00Z',
+    )
+
+    utils.add_current_user_playlists_response([
+        utils.spotify_playlist_factory(
+            name="Tarantino Tunes",
+            owner={
+                'display_name': "Valentin",
+            },
+        )
+    ])
+
+    logging_mock = mocker.patch('statify.statify.logger')
+
+    statify._main(argparse.Namespace(command='pull', what='playlists'))
+
+    assert [call.request.url for call in responses.calls] == [
+        'https://api.spotify.com/v1/me/playlists?limit=50&offset=0',
+    ]
+    assert logging_mock.info.call_args_list == []
+    assert [
+        tuple(r) for r in in_memory_database.select_from('Playlist', ['name'])
+    ] == [
+        ('Tarantino Tunes',),
+    ]
+    assert set(
+        tuple(r) for r in in_memory_database.select_from('SongInPlaylist', ['*'])
+    ) == {
+        ('t1', 'test_playlist_id', '2020-01-16T08:00:00Z', None),
+    }
+
+
 @responses.activate
 def test_pull_playlist_add_track(
     statify_config, cached_token, in_memory_database, mocker
@@ -269,8 +324,8 @@ def test_pull_playlist_add_track(
     assert set(
         tuple(r) for r in in_memory_database.select_from('SongInPlaylist', ['*'])
     ) == {
-        ('t1', 'test_playlist_id', '2020-01-16T08:00:00Z'),
-        ('t2', 'test_playlist_id', '2020-01-16T08:05:00Z'),
+        ('t1', 'test_playlist_id', '2020-01-16T08:00:00Z', 1024),
+        ('t2', 'test_playlist_id', '2020-01-16T08:05:00Z', 2048),
     }
 
 
@@ -376,7 +431,7 @@ def test_pull_playlist_delete_track(
     assert set(
         tuple(r) for r in in_memory_database.select_from('SongInPlaylist', ['*'])
     ) == {
-        ('t1', 'test_playlist_id', '2020-01-16T08:00:00Z'),
+        ('t1', 'test_playlist_id', '2020-01-16T08:00:00Z', 1024),
     }
 
 
@@ -391,3 +446,206 @@ def test_pull_playlist_user_not_authenticated(
     assert print_mock.mock_calls == [
         mocker.call('User not authenticated. Authenticate with `statify auth`')
     ]
+
+
+@responses.activate
+def test_pull_playlist_concurrently(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    """
+    3 playlists with 1 track each, fetched from a thread pool.
+    """
+    utils.update_config(concurrency=3)
+
+    playlist_ids = ['p1', 'p2', 'p3']
+    utils.add_current_user_playlists_response([
+        utils.spotify_playlist_factory(id=playlist_id, name=playlist_id)
+        for playlist_id in playlist_ids
+    ])
+    for playlist_id in playlist_ids:
+        utils.add_playlist_tracks_response(
+            [
+                utils.spotify_playlist_track_factory(
+                    track=utils.spotify_track_factory(
+                        id='t_{}'.format(playlist_id),
+                    ),
+                ),
+            ],
+            playlist_id=playlist_id,
+        )
+
+    mocker.patch('statify.statify.logger')
+
+    statify._main(argparse.Namespace(command='pull', what='playlists'))
+
+    assert set(
+        tuple(r) for r in in_memory_database.select_from(
+            'SongInPlaylist', ['song_id', 'playlist_id'],
+        )
+    ) == {
+        ('t_p1', 'p1'),
+        ('t_p2', 'p2'),
+        ('t_p3', 'p3'),
+    }
+
+
+@responses.activate
+def test_pull_playlist_by_pages(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    """
+    The tracks are staged page by page, duplicates included, and the removed
+    ones are deleted with a single statement.
+    """
+    mocker.patch('statify.statify.PLAYLIST_PAGE_SIZE', 2)
+    for song_id in ['t0', 't1', 't9']:
+        in_memory_database.insert_into('SongInPlaylist',
+            song_id=song_id,
+            playlist_id='test_playlist_id',
+            added_at='2020-01-01T00:00:00Z',
+        )
+
+    utils.add_current_user_playlists_response([
+        utils.spotify_playlist_factory(name="Tarantino"),
+    ])
+    utils.add_playlist_tracks_response([
+        utils.spotify_playlist_track_factory(
+            added_at='2020-01-16T08:00:00Z',
+            track=utils.spotify_track_factory(id=song_id, name=song_id),
+        )
+        for song_id in ['t1', 't2', 't3', 't2']
+    ])
+
+    logging_mock = mocker.patch('statify.statify.logger')
+    stage = mocker.spy(in_memory_database, 'stage_playlist_tracks')
+    delete_from = mocker.spy(in_memory_database, 'delete_from')
+
+    statify._main(argparse.Namespace(command='pull', what='playlists'))
+
+    assert stage.call_count == 2
+    assert delete_from.call_count == 0
+    assert logging_mock.info.call_args_list == [
+        mocker.call(
+            'Deleted song: %s in playlist %s (%s)',
+            song_id, 'test_playlist_id', 'Tarantino',
+        )
+        for song_id in ['t0', 't9']
+    ] + [
+        mocker.call(
+            'Added song: %s (%s) in playlist %s (%s)',
+            song_id, song_id, 'test_playlist_id', 'Tarantino',
+        )
+        for song_id in ['t2', 't3', 't2']
+    ]
+    assert sorted(
+        tuple(r) for r in in_memory_database.select_from(
+            'SongInPlaylist', ['position', 'song_id', 'added_at'],
+        )
+    ) == [
+        (1024, 't1', '2020-01-01T00:00:00Z'),
+        (2048, 't2', '2020-01-16T08:00:00Z'),
+        (3072, 't3', '2020-01-16T08:00:00Z'),
+        (4096, 't2', '2020-01-16T08:00:00Z'),
+    ]
+
+
+def test_fetch_playlists_tracks_concurrently_error(mocker):
+    """
+    An error while fetching a playlist is raised in the consuming thread.
+    """
+    def playlist_tracks(playlist_id):
+        yield {'track': {'id': 't1'}}
+        if playlist_id == 'p2':
+            raise ValueError(playlist_id)
+
+    spotify = mocker.Mock(concurrency=2, playlist_tracks=playlist_tracks)
+    playlists = [mocker.Mock(spotify_id=p) for p in ['p1', 'p2']]
+
+    fetched = statify.fetch_playlists_tracks(spotify, playlists)
+    playlist_obj, pages = next(fetched)
+    assert list(pages) == [[{'track': {'id': 't1'}}]]
+    playlist_obj, pages = next(fetched)
+    with pytest.raises(ValueError):
+        list(pages)
+    fetched.close()
+
+
+def test_fetch_playlists_tracks_concurrently_stops_on_error(mocker):
+    """
+    After an error, the playlists not being fetched yet aren't fetched.
+    """
+    fetched_ids = []
+
+    def playlist_tracks(playlist_id):
+        fetched_ids.append(playlist_id)
+        if playlist_id == 'p0':
+            raise ValueError(playlist_id)
+        yield {'track': {'id': 't1'}}
+
+    spotify = mocker.Mock(concurrency=2, playlist_tracks=playlist_tracks)
+    playlists = [mocker.Mock(spotify_id='p{}'.format(i)) for i in range(50)]
+
+    fetched = statify.fetch_playlists_tracks(spotify, playlists)
+    playlist_obj, pages = next(fetched)
+    with pytest.raises(ValueError):
+        list(pages)
+    fetched.close()
+
+    assert set(fetched_ids) <= {'p0', 'p1'}
+
+
+@responses.activate
+def test_pull_playlist_interrupted(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    """
+    2 playlists, the tracks of the second can't be fetched. The first one is
+    committed and checkpointed.
+    """
+    utils.update_config(commit_every_rows=1)
+    utils.add_current_user_playlists_response([
+        utils.spotify_playlist_factory(id=playlist_id, name=playlist_id)
+        for playlist_id in ['p1', 'p2']
+    ])
+    utils.add_playlist_tracks_response(
+        [utils.spotify_playlist_track_factory()],
+        playlist_id='p1',
+    )
+    mocker.patch('statify.statify.logger')
+    commit = mocker.spy(in_memory_database, 'commit')
+
+    with pytest.raises(requests.ConnectionError):
+        statify._main(argparse.Namespace(command='pull', what='playlists'))
+
+    assert commit.call_count == 1
+    assert statify.load_checkpoint() == {'synced_playlists': ['p1']}
+
+
+@responses.activate
+def test_pull_playlist_resume_from_checkpoint(
+    statify_config, cached_token, in_memory_database, mocker
+):
+    """
+    2 changed playlists, the first one was synced by an interrupted pull.
+    """
+    statify.save_checkpoint({'synced_playlists': ['p1']})
+    utils.add_current_user_playlists_response([
+        utils.spotify_playlist_factory(id=playlist_id, name=playlist_id)
+        for playlist_id in ['p1', 'p2']
+    ])
+    utils.add_playlist_tracks_response(
+        [utils.spotify_playlist_track_factory()],
+        playlist_id='p2',
+    )
+    logging_mock = mocker.patch('statify.statify.logger')
+
+    statify._main(argparse.Namespace(command='pull', what='playlists'))
+
+    assert logging_mock.info.call_args_list[0] == mocker.call(
+        'Resuming interrupted pull, %s playlists already synced', 1,
+    )
+    assert [call.request.url.split('?')[0] for call in responses.calls] == [
+        'https://api.spotify.com/v1/me/playlists',
+        'https://api.spotify.com/v1/playlists/p2/tracks',
+    ]
+    assert statify.load_checkpoint() == {}
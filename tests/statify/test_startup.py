@@ -0,0 +1,36 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import statify
+
+
+# Modules only needed by some subcommands, and slow to import
+DEFERRED_MODULES = [
+    'spotipy', 'requests', 'urllib3', 'pypika', 'yaml', 'pkg_resources',
+    'distutils',
+]
+
+# Generous budget for the import of the CLI module, in microseconds
+IMPORT_TIME_BUDGET = 300000
+
+
+def test_cli_import_time():
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import statify.statify'],
+        cwd=str(Path(statify.__file__).parents[1]),
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    # Lines are like "import time:   self [us] | cumulative | module"
+    cumulative_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        cumulative_times[module.strip()] = int(cumulative)
+
+    imported = {name.split('.')[0] for name in cumulative_times}
+    assert imported.isdisjoint(DEFERRED_MODULES)
+    assert cumulative_times['statify.statify'] < IMPORT_TIME_BUDGET
@@ -0,0 +1,104 @@
+import argparse
+
+import json
+import re
+
+import pytest
+import responses
+
+from statify import stats, statify
+from .. import utils
+
+
+def stats_args(**args):
+    return argparse.Namespace(**{
+        'command': 'stats',
+        'what': None,
+        'limit': 20,
+        'format': 'text',
+        'output': None,
+        **args,
+    })
+
+
+@responses.activate
+def test_pull_listenings_updates_aggregates(
+    statify_config, cached_token, in_memory_database, mocker, capsys
+):
+    in_memory_database.insert_into('ListeningsBySong',
+        song_id='t1',
+        play_count=10,
+    )
+    utils.add_current_user_recently_played_response([
+        utils.spotify_listening_factory(
+            played_at=played_at,
+            track=utils.spotify_track_factory(
+                id=track_id,
+                artists=[
+                    utils.spotify_artist_factory(id='a1', name="Artist 1"),
+                    utils.spotify_artist_factory(id=artist_id, name=artist_id),
+                ],
+            ),
+        )
+        for played_at, track_id, artist_id in [
+            ("2020-07-08T10:12:00.000Z", 't2', 'a3'),
+            ("2020-07-07T16:53:23.000Z", 't1', 'a2'),
+            ("2020-07-07T16:48:45.000Z", 't2', 'a3'),
+        ]
+    ])
+    mocker.patch('statify.statify.logger')
+
+    statify._main(argparse.Namespace(command='pull', what='listenings'))
+
+    def counts(table_name):
+        return set(
+            tuple(r) for r in in_memory_database.select_from(table_name, ['*'])
+        )
+
+    assert counts('ListeningsByDay') == {('2020-07-08', 1), ('2020-07-07', 2)}
+    assert counts('ListeningsByHour') == {('10', 1), ('16', 2)}
+    assert counts('ListeningsBySong') == {('t1', 11), ('t2', 2)}
+    assert counts('ListeningsByArtist') == {('a1', 3), ('a2', 1), ('a3', 2)}
+
+    capsys.readouterr()
+
+    statify._main(stats_args(what='artists', limit=2))
+
+    assert capsys.readouterr().out == 'Artist 1\t3\na3\t2\n'
+
+
+def test_stats_export(statify_config, in_memory_database, capsys):
+    in_memory_database.insert_into('ListeningsByDay',
+        day='2020-07-07',
+        play_count=12,
+    )
+    in_memory_database.insert_into('ListeningsByDay',
+        day='2020-07-08',
+        play_count=3,
+    )
+
+    statify._main(stats_args(what='days', format='csv'))
+    assert capsys.readouterr().out.splitlines() == [
+        'day,play_count',
+        '2020-07-07,12',
+        '2020-07-08,3',
+    ]
+
+    statify._main(stats_args(what='days', format='json', limit=1))
+    assert json.loads(capsys.readouterr().out) == [
+        {'day': '2020-07-07', 'play_count': 12},
+    ]
+
+
+@pytest.mark.parametrize('report', stats.REPORTS, ids=lambda r: r.name)
+def test_report_avoids_full_scans(in_memory_database, report):
+    plan = [
+        row['detail'] for row in in_memory_database.query(
+            'EXPLAIN QUERY PLAN {}'.format(report.sql), 10,
+        )
+    ]
+
+    for detail in plan:
+        assert not re.match(r'^SCAN (TABLE )?\S+( AS \S+)?$', detail), plan
+    for index in report.indexes:
+        assert any(index in detail for detail in plan), plan
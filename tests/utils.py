@@ -1,9 +1,19 @@
 import random
 import string
 
+import responses
+import yaml
+
+from statify import config
 from statify.database_client import Song, Listening
 
-import responses
+
+def update_config(**values):
+    with open(str(config.CONFIG_PATH)) as config_file:
+        conf = yaml.safe_load(config_file)
+    conf.update(values)
+    with open(str(config.CONFIG_PATH), 'w') as config_file:
+        yaml.dump(conf, config_file)
 
 
 def add_current_user_playlists_response(playlists):